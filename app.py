@@ -1,5 +1,5 @@
 import os
-from flask import Flask, jsonify, request, make_response, send_from_directory, render_template, redirect, url_for
+from flask import Flask, jsonify, request, make_response, send_from_directory, render_template, redirect, url_for, g
 from flask_login import current_user
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
@@ -21,6 +21,8 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 import shutil
 import functools
 import time
+from sharding import RoomShardedRedisManager
+from sessions import ServerSessionInterface, RedisSessionBackend, MemorySessionBackend
 
 # Configure logging with more detailed format
 logging.basicConfig(
@@ -143,6 +145,27 @@ else:
 
 cache = Cache(app, config=cache_config)
 
+# Server-side sessions: Redis keys expire on their own TTL; without Redis
+# sessions are kept in-process (single worker only).
+app.config['SESSION_NEAR_CACHE_TTL'] = float(os.environ.get('SESSION_NEAR_CACHE_TTL', 2))
+app.config['SESSION_TOUCH_INTERVAL'] = int(os.environ.get('SESSION_TOUCH_INTERVAL', 60))
+app.config['SESSION_TOUCH_FLUSH_INTERVAL'] = float(os.environ.get('SESSION_TOUCH_FLUSH_INTERVAL', 5))
+# Must stay outside CACHE_KEY_PREFIX: cache.clear() deletes every key under
+# it, which would log out the whole cluster on startup and shutdown.
+app.config['SESSION_KEY_PREFIX'] = os.environ.get('SESSION_KEY_PREFIX', 'session:eunica:')
+if cache_config['CACHE_TYPE'] == 'redis':
+    if app.config['SESSION_KEY_PREFIX'].startswith(cache_config['CACHE_KEY_PREFIX']):
+        raise RuntimeError("SESSION_KEY_PREFIX must not start with CACHE_KEY_PREFIX")
+    session_backend = RedisSessionBackend(redis_client, prefix=app.config['SESSION_KEY_PREFIX'])
+else:
+    session_backend = MemorySessionBackend()
+app.session_interface = ServerSessionInterface(
+    session_backend,
+    near_cache_ttl=app.config['SESSION_NEAR_CACHE_TTL'],
+    touch_interval=app.config['SESSION_TOUCH_INTERVAL'],
+    flush_interval=app.config['SESSION_TOUCH_FLUSH_INTERVAL']
+)
+
 # Enhanced rate limiter
 limiter = Limiter(
     app=app,
@@ -153,17 +176,45 @@ limiter = Limiter(
     headers_enabled=True
 )
 
-# Optimized compression settings
-compress = Compress()
-compress.init_app(app)
-app.config['COMPRESS_ALGORITHM'] = 'gzip'
+# Compressed bodies of versioned pages, keyed by algorithm and ETag.
+# Responses that did not opt in via g.page_cache_key are never stored.
+class CompressedPageCache:
+    def get(self, key):
+        if key.endswith(';None'):
+            return None
+        value = cache.get(key)
+        if value is not None:
+            g.page_cache_hit = key
+        return value
+
+    def set(self, key, value):
+        # Flask-Compress calls set after every get, hit or miss
+        if not key.endswith(';None') and g.get('page_cache_hit') != key:
+            cache.set(key, value, timeout=app.config['PAGE_CACHE_TIMEOUT'])
+
+# Optimized compression settings (must be set before init_app reads them)
+app.config['PAGE_CACHE_TIMEOUT'] = 300
+app.config['FRAGMENT_CACHE_TIMEOUT'] = 300
+# Dynamic responses favour speed; static assets are compressed once at
+# high levels by compression.compress_static and cached by mtime.
+app.config['COMPRESS_ALGORITHM'] = ['zstd', 'br', 'gzip']
+app.config['COMPRESS_ZSTD_LEVEL'] = 3
+app.config['COMPRESS_BR_LEVEL'] = 4
 app.config['COMPRESS_LEVEL'] = 6
-app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_STATIC_LEVELS'] = {'zstd': 19, 'br': 11, 'gzip': 9}
+# Measured with the compress_min_size benchmark: chat JSON/HTML of ~300
+# bytes already halves in size for ~10-25us of CPU, below ~250 bytes the
+# savings drop under 100 bytes and the payload fits one packet anyway.
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 256))
 app.config['COMPRESS_MIMETYPES'] = [
     'text/html', 'text/css', 'text/xml',
     'application/json', 'application/javascript',
     'text/javascript'
 ]
+app.config['COMPRESS_CACHE_BACKEND'] = CompressedPageCache
+app.config['COMPRESS_CACHE_KEY'] = lambda request: g.get('page_cache_key')
+compress = Compress()
+compress.init_app(app)
 
 # File upload configurations with cleanup
 UPLOAD_FOLDER = 'static/uploads'
@@ -179,6 +230,51 @@ os.makedirs(TEMP_FOLDER, exist_ok=True)
 # Configure database
 db.init_app(app)
 
+# Websocket permessage-deflate (applied by compression.py) and long-polling
+# compression, configurable per deployment
+app.config['SOCKETIO_ASYNC_MODE'] = 'threading'
+app.config['WS_COMPRESSION'] = os.environ.get('WS_COMPRESSION', 'true').lower() == 'true'
+app.config['WS_CONTEXT_TAKEOVER'] = os.environ.get('WS_CONTEXT_TAKEOVER', 'true').lower() == 'true'
+app.config['WS_MAX_WINDOW_BITS'] = int(os.environ.get('WS_MAX_WINDOW_BITS', 15))
+app.config['WS_POLLING_COMPRESSION_THRESHOLD'] = int(os.environ.get('WS_POLLING_COMPRESSION_THRESHOLD', 256))
+
+# Per-room Redis channels so nodes only receive traffic for rooms their
+# clients are in, with rooms placed on nodes by consistent hashing. Clients
+# reconnect with ?node=<owner> in the Socket.IO URL; the load balancer must
+# route on that parameter to the server named SOCKETIO_NODE_ID, e.g. with
+# HAProxy: use-server %[urlp(node)] if { urlp(node) -m found }
+# Off by default: old and new managers cannot share a cluster, so enable it
+# on every node at once (full restart, not rolling).
+app.config['SOCKETIO_ROOM_CHANNELS'] = os.environ.get('SOCKETIO_ROOM_CHANNELS', 'false').lower() == 'true'
+app.config['SOCKETIO_NODE_ID'] = os.environ.get('SOCKETIO_NODE_ID')
+app.config['SOCKETIO_HEARTBEAT_INTERVAL'] = float(os.environ.get('SOCKETIO_HEARTBEAT_INTERVAL', 5))
+socketio_queue = {}
+if REDIS_URL and app.config['SOCKETIO_ROOM_CHANNELS']:
+    socketio_queue['client_manager'] = RoomShardedRedisManager(
+        REDIS_URL,
+        node_id=app.config['SOCKETIO_NODE_ID'],
+        heartbeat_interval=app.config['SOCKETIO_HEARTBEAT_INTERVAL']
+    )
+elif REDIS_URL:
+    socketio_queue['message_queue'] = REDIS_URL
+
+# Async data access (async_db.py) for the hot socket operations; the sync
+# Flask-SQLAlchemy path stays the default
+app.config['SOCKETIO_ASYNC_DB'] = os.environ.get('SOCKETIO_ASYNC_DB', 'false').lower() == 'true'
+# Defaults to the sync engine's resolved URL (see async_db.app_database_url)
+app.config['ASYNC_DATABASE_URL'] = os.environ.get('ASYNC_DATABASE_URL')
+app.config['ASYNC_DB_POOL_SIZE'] = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+app.config['ASYNC_DB_MAX_OVERFLOW'] = int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 10))
+
+# Background health probing; /health/* endpoints only read the cached result
+app.config['HEALTH_PROBE_INTERVAL'] = float(os.environ.get('HEALTH_PROBE_INTERVAL', 5))
+app.config['HEALTH_PROBE_TIMEOUT'] = float(os.environ.get('HEALTH_PROBE_TIMEOUT', 2))
+app.config['HEALTH_POOL_SATURATION_LIMIT'] = float(os.environ.get('HEALTH_POOL_SATURATION_LIMIT', 0.95))
+# A saturated pool is reported as a warning; failing readiness on it takes
+# the node out of rotation exactly when load is highest, shifting that load
+# onto the remaining nodes.
+app.config['HEALTH_FAIL_ON_POOL_SATURATION'] = os.environ.get('HEALTH_FAIL_ON_POOL_SATURATION', 'false').lower() == 'true'
+
 # Enhanced WebSocket configuration
 socketio.init_app(app, 
     cors_allowed_origins=os.environ.get("CORS_ORIGINS", "*"),
@@ -190,9 +286,11 @@ socketio.init_app(app,
     reconnection_delay_max=5,
     logger=True,
     engineio_logger=True,
-    async_mode='threading',
+    async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+    http_compression=True,
+    compression_threshold=app.config['WS_POLLING_COMPRESSION_THRESHOLD'],
     cookie=True,
-    message_queue=REDIS_URL if REDIS_URL else None
+    **socketio_queue
 )
 
 # Enhanced login manager configuration
@@ -220,15 +318,41 @@ def cleanup_temp_files():
 def cleanup_expired_sessions():
     """Clean up expired sessions"""
     try:
-        if REDIS_URL and redis_client:
-            pattern = f"{cache_config['CACHE_KEY_PREFIX']}session:*"
-            for key in redis_client.scan_iter(pattern):
-                if redis_client.ttl(key) <= 0:
-                    redis_client.delete(key)
-        logger.info("Expired sessions cleanup completed")
+        # Redis expires session keys itself; only the in-process store needs purging
+        purged = app.session_interface.backend.purge_expired()
+        logger.info(f"Expired sessions cleanup completed, {purged} purged")
     except Exception as e:
         logger.error(f"Error cleaning up sessions: {str(e)}")
 
+def backfill_room_summaries():
+    """Build room summaries once when the table is new but messages exist"""
+    from models import Message, RoomSummary
+    try:
+        if (db.session.query(RoomSummary.chatroom_id).first() is None
+                and db.session.query(Message.id).first() is not None):
+            rebuilt = RoomSummary.rebuild()
+            logger.info(f"Backfilled {rebuilt} room summaries")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error backfilling room summaries: {str(e)}")
+
+def create_missing_indexes():
+    """Add indexes declared on existing tables; create_all only builds new tables"""
+    try:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+    except Exception as e:
+        logger.error(f"Error creating indexes: {str(e)}")
+
+@app.cli.command('rebuild-room-summaries')
+def rebuild_room_summaries():
+    """Recompute every room summary from the message table"""
+    from models import RoomSummary
+    rebuilt = RoomSummary.rebuild()
+    cache.clear()  # Drop sidebar fragments rendered from the old summaries
+    logger.info(f"Rebuilt {rebuilt} room summaries")
+
 # Static file serving with caching
 @app.route('/static/<path:filename>')
 @cache.cached(timeout=43200)  # 12 hours
@@ -284,42 +408,14 @@ def register_error_handlers(app):
 
 register_error_handlers(app)
 
-# Health check endpoint
-@app.route('/health')
-@limiter.exempt
-def health_check():
-    try:
-        db.session.execute('SELECT 1')
-        db.session.remove()
-        
-        cache_status = False
-        if REDIS_URL:
-            try:
-                cache_status = redis_client.ping()
-            except:
-                pass
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'cache': cache_status,
-            'version': '1.0.0',
-            'timestamp': datetime.now().isoformat(),
-            'uptime': time.time() - app.start_time
-        })
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 503
-
 # Initialize application
 try:
     with app.app_context():
         app.start_time = time.time()
         import models
         db.create_all()
+        create_missing_indexes()
+        backfill_room_summaries()
         schedule_cleanup()
         logger.info('Application initialized successfully')
 except Exception as e:
@@ -328,3 +424,5 @@ except Exception as e:
 
 from chat_socket import *
 from routes import *
+import compression
+import health
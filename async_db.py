@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import app, db
+from models import ChatRoom, Message, RoomSummary, user_chatroom
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def async_database_url(url):
+    """Map the app's sync DATABASE_URL onto the matching asyncio driver"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    url = url.set(drivername=driver)
+    if driver == 'postgresql+asyncpg' and 'sslmode' in url.query:
+        # asyncpg takes ``ssl`` rather than libpq's ``sslmode``
+        sslmode = url.query['sslmode']
+        url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': sslmode})
+    return url
+
+def app_database_url():
+    """The sync engine's URL as Flask-SQLAlchemy resolved it.
+
+    Relative SQLite paths are resolved into the instance folder there,
+    while aiosqlite would open them relative to the working directory.
+    """
+    with app.app_context():
+        return db.engine.url
+
+class AsyncDatabase:
+    """SQLAlchemy asyncio access path for the hot Socket.IO operations.
+
+    The coroutines can be awaited directly from an asyncio server. The
+    Flask-SocketIO handlers are synchronous, so ``run`` submits a coroutine
+    to one shared event loop thread; database I/O for every connection is
+    then multiplexed over that loop and a small async pool instead of each
+    connection thread holding its own pooled connection.
+    """
+
+    def __init__(self, url, pool_size=10, max_overflow=10):
+        url = async_database_url(url)
+        options = {}
+        if url.get_backend_name() != 'sqlite':
+            options.update(pool_size=pool_size, max_overflow=max_overflow,
+                           pool_pre_ping=True, pool_recycle=300)
+        self.engine = create_async_engine(url, **options)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self._loop = None
+        self._lock = threading.Lock()
+
+    # Queries
+
+    async def room_members(self, chatroom_id, session=None):
+        """Return (room name, member ids) for a room, or (None, []) if it does not exist"""
+        stmt = select(ChatRoom.name, user_chatroom.c.user_id).outerjoin(
+            user_chatroom, user_chatroom.c.chatroom_id == ChatRoom.id
+        ).where(ChatRoom.id == chatroom_id)
+        if session is None:
+            async with self.sessionmaker() as session:
+                rows = (await session.execute(stmt)).all()
+        else:
+            rows = (await session.execute(stmt)).all()
+        if not rows:
+            return None, []
+        return rows[0][0], [user_id for _, user_id in rows if user_id is not None]
+
+    async def is_member(self, user_id, chatroom_id):
+        async with self.sessionmaker() as session:
+            found = await session.scalar(
+                select(user_chatroom.c.user_id).where(
+                    user_chatroom.c.user_id == user_id,
+                    user_chatroom.c.chatroom_id == chatroom_id
+                )
+            )
+        return found is not None
+
+    async def send_message(self, sender_id, sender_username, chatroom_id, content,
+                           message_type='text', file_path=None, file_name=None):
+        """Insert a message and fold it into the room summary in one transaction.
+
+        Returns (message, room name, member ids); raises ValueError when the
+        sender is not a member of the room.
+        """
+        async with self.sessionmaker() as session:
+            async with session.begin():
+                room_name, member_ids = await self.room_members(chatroom_id, session)
+                if sender_id not in member_ids:
+                    raise ValueError("Invalid chat room or unauthorized access")
+                message = Message(
+                    content=content,
+                    message_type=message_type,
+                    file_path=file_path,
+                    file_name=file_name,
+                    sender_id=sender_id,
+                    chatroom_id=chatroom_id
+                )
+                session.add(message)
+                await session.flush()
+                await session.execute(RoomSummary.record_statement(
+                    self.engine.dialect.name, message, sender_id, sender_username
+                ))
+        return message, room_name, member_ids
+
+    async def history(self, chatroom_id, after=None, limit=200, before=None):
+        """Return (oldest-first [(message, username)], has_more)"""
+        async with self.sessionmaker() as session:
+            rows = (await session.execute(Message.history_statement(chatroom_id, after, limit, before))).all()
+        return Message.history_page(rows, after, limit)
+
+    # Bridge for synchronous callers
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-db', daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def run(self, coro, timeout=30):
+        """Run ``coro`` on the shared event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result(timeout)
+
+    def dispose(self):
+        if self._loop is not None:
+            self.run(self.engine.dispose())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+_async_db = None
+_async_db_lock = threading.Lock()
+
+def get_async_db():
+    """Process-wide AsyncDatabase, created on first use"""
+    global _async_db
+    if _async_db is None:
+        with _async_db_lock:
+            if _async_db is None:
+                _async_db = AsyncDatabase(
+                    app.config['ASYNC_DATABASE_URL'] or app_database_url(),
+                    pool_size=app.config['ASYNC_DB_POOL_SIZE'],
+                    max_overflow=app.config['ASYNC_DB_MAX_OVERFLOW']
+                )
+                logger.info(f"Async database path using {_async_db.engine.url.drivername}")
+    return _async_db
@@ -0,0 +1,18 @@
+"""Benchmark and load-test suite for Eunica.
+
+Seeds synthetic users, rooms and messages, drives the HTTP routes through
+the Flask test client and the Socket.IO events through concurrent
+``socketio`` test clients, and reports p50/p99 latency, throughput and
+memory per scenario.
+
+Usage::
+
+    python -m benchmarks --database-url sqlite:///bench.db --messages 1000000
+    python -m benchmarks --output results.json
+    python -m benchmarks --baseline baseline.json --threshold 0.10
+    python -m benchmarks --database-url postgresql:///bench --scenario db_send_sync --scenario db_send_async
+
+Results are written as JSON. With ``--baseline`` the run is compared
+against a stored result and exits non-zero when a scenario regresses by
+more than the threshold.
+"""
@@ -0,0 +1,63 @@
+import argparse
+import logging
+import os
+import sys
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Eunica benchmark suite')
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db'),
+                        help='SQLite or PostgreSQL URL to seed and benchmark against')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--members-per-room', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=50, help='Requests per HTTP scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent Socket.IO clients')
+    parser.add_argument('--messages-per-client', type=int, default=50)
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        help='Scenario to run (repeatable); defaults to all')
+    parser.add_argument('--skip-seed', action='store_true', help='Use the database as-is')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Stored result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative change that counts as a regression')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # app.py reads its configuration at import time
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    logging.disable(logging.INFO)
+
+    from benchmarks import harness, seed
+    from benchmarks.scenarios import SCENARIOS, BenchContext, run_scenarios
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}; available: {', '.join(SCENARIOS)}")
+        return 2
+
+    if not args.skip_seed and not seed.is_seeded(args.users, args.rooms, args.messages):
+        seed.seed(args.users, args.rooms, args.messages, args.members_per_room)
+
+    ctx = BenchContext(args.iterations, args.concurrency, args.messages_per_client)
+    results = run_scenarios(names, ctx)
+    dataset = {'users': args.users, 'rooms': args.rooms, 'messages': args.messages}
+    report = harness.build_report(results, dataset, args.database_url)
+    harness.save_report(report, args.output)
+    print(harness.format_results(results))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        rows, regressions = harness.compare_reports(report, harness.load_report(args.baseline), args.threshold)
+        print(harness.format_comparison(rows))
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
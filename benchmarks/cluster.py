@@ -0,0 +1,266 @@
+"""Multi-process fan-out benchmark for Socket.IO message queue managers.
+
+Starts a local pub/sub broker speaking the Redis protocol, then runs clusters
+of N node processes. Rooms scale with N and every room has the same number
+of members; each member is hosted by the node its connection lands on and
+sends a fixed share of the messages. Total cluster traffic grows with N, and
+per-node CPU shows whether a node pays for the whole cluster or only for its
+own rooms.
+
+Placement is what each mode produces in the app:
+
+- ``broadcast``: stock RedisManager, connections spread by the load balancer
+- ``room-channels``: per-room channels, same spread placement
+- ``sharded``: RoomShardedRedisManager; connections start spread, then follow
+  the room owner named by the nodes' own hash ring, as the client does
+  after ``room_joined``
+
+Usage::
+
+    python -m benchmarks.cluster --sizes 1 2 4 8 --duration 5 --rate 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import threading
+import time
+
+class PubSubBroker:
+    """Minimal RESP server implementing the pub/sub subset of Redis"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.subscribers = {}  # channel -> set of writers
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    @property
+    def url(self):
+        return f'redis://{self.host}:{self.port}/0'
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self.ready.wait()
+        return self.url
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(
+            asyncio.start_server(self._serve, self.host, self.port))
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    @staticmethod
+    def _bulk(value):
+        if isinstance(value, str):
+            value = value.encode()
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _serve(self, reader, writer):
+        channels = set()
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                command = args[0].upper()
+                if command == b'PING':
+                    writer.write(b'+PONG\r\n')
+                elif command == b'SUBSCRIBE':
+                    for channel in args[1:]:
+                        channels.add(channel)
+                        self.subscribers.setdefault(channel, set()).add(writer)
+                        writer.write(b'*3\r\n' + self._bulk('subscribe') + self._bulk(channel)
+                                     + b':%d\r\n' % len(channels))
+                elif command == b'UNSUBSCRIBE':
+                    for channel in (args[1:] or list(channels)):
+                        channels.discard(channel)
+                        self.subscribers.get(channel, set()).discard(writer)
+                        writer.write(b'*3\r\n' + self._bulk('unsubscribe') + self._bulk(channel)
+                                     + b':%d\r\n' % len(channels))
+                elif command == b'PUBLISH':
+                    channel, data = args[1], args[2]
+                    receivers = list(self.subscribers.get(channel, ()))
+                    frame = b'*3\r\n' + self._bulk('message') + self._bulk(channel) + self._bulk(data)
+                    for subscriber in receivers:
+                        subscriber.write(frame)
+                    writer.write(b':%d\r\n' % len(receivers))
+                elif command == b'SELECT':
+                    writer.write(b'+OK\r\n')
+                else:
+                    writer.write(b'-ERR unknown command\r\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in channels:
+                self.subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+def _make_manager(mode, url, node_id):
+    import socketio
+    from sharding import RoomChannelRedisManager, RoomShardedRedisManager
+    if mode == 'sharded':
+        return RoomShardedRedisManager(url, channel='bench', node_id=node_id,
+                                       heartbeat_interval=0.2)
+    if mode == 'room-channels':
+        return RoomChannelRedisManager(url, channel='bench')
+    return socketio.RedisManager(url, channel='bench')
+
+def run_node(mode, url, node_id, size, rooms, owners, placement, rate, duration,
+             start, results):
+    """Node process: report room owners, host the clients placed here, emit"""
+    logging.disable(logging.CRITICAL)
+    import socketio
+
+    manager = _make_manager(mode, url, node_id)
+    server = socketio.Server(async_mode='threading', client_manager=manager)
+    server.manager_initialized = True
+    manager.initialize()
+
+    if mode == 'sharded':
+        # Wait for heartbeats to assemble the full ring, then report where
+        # this node's ring places every room
+        deadline = time.monotonic() + 15
+        while len(manager.ring.nodes) < size and time.monotonic() < deadline:
+            time.sleep(0.05)
+        owners.put((node_id, {room: manager.node_for(room) for room in rooms}))
+
+    # Simulated clients: registered with the manager like real connections,
+    # so fan-out encodes packets for each of them.
+    clients = placement.get()
+    for room, member in clients:
+        sid = manager.connect(f'{node_id}-{room}-{member}', '/')
+        manager.enter_room(sid, '/', room)
+
+    start.wait()
+    time.sleep(1.0)  # let subscriptions settle
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    sent = 0
+    interval = 1.0 / rate if rate else None
+    next_send = wall_start
+    while time.perf_counter() - wall_start < duration:
+        if clients and interval:
+            room, _ = clients[sent % len(clients)]
+            server.emit('new_message', {
+                'message': f'load {sent}', 'message_type': 'text', 'sender_id': 1,
+                'username': node_id, 'timestamp': '12:00'
+            }, room=room)
+            sent += 1
+            next_send += interval
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            time.sleep(0.01)
+    results.put({
+        'node_id': node_id,
+        'cpu_s': time.process_time() - cpu_start,
+        'wall_s': time.perf_counter() - wall_start,
+        'sent': sent,
+        'rooms_hosted': len({room for room, _ in clients}),
+    })
+    if hasattr(manager, 'shutdown'):
+        manager.shutdown()
+
+def _place(mode, node_ids, rooms, clients_per_room, owners, seed):
+    """Map each (room, member) connection to the node that ends up hosting it"""
+    spread = random.Random(seed)
+    initial = {(room, member): spread.choice(node_ids)
+               for room in rooms for member in range(clients_per_room)}
+    if mode != 'sharded':
+        return initial
+    views = dict(owners.get(timeout=60) for _ in node_ids)
+    placements = {tuple(sorted(view.items())) for view in views.values()}
+    if len(placements) != 1:
+        raise RuntimeError('Nodes disagree on room owners; the ring did not converge')
+    owner = next(iter(views.values()))
+    return {client: owner[client[0]] for client in initial}
+
+def run_cluster(mode, url, size, rooms_per_node, clients_per_room, rate, duration, seed=0):
+    node_ids = [f'node-{i}' for i in range(size)]
+    rooms = [str(room) for room in range(rooms_per_node * size)]
+
+    ctx = multiprocessing.get_context('spawn')
+    start = ctx.Event()
+    owners = ctx.Queue()
+    results = ctx.Queue()
+    placements = {node: ctx.Queue() for node in node_ids}
+    processes = [
+        ctx.Process(target=run_node, args=(mode, url, node, size, rooms, owners, placements[node],
+                                          rate, duration, start, results))
+        for node in node_ids
+    ]
+    for process in processes:
+        process.start()
+    placement = _place(mode, node_ids, rooms, clients_per_room, owners, seed)
+    for node in node_ids:
+        placements[node].put([client for client, host in placement.items() if host == node])
+    time.sleep(2.0)  # imports and connections
+    start.set()
+    reports = [results.get(timeout=duration + 60) for _ in processes]
+    for process in processes:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+    cpu = [r['cpu_s'] / r['wall_s'] * 100 for r in reports]
+    nodes_per_room = {}
+    for (room, _), host in placement.items():
+        nodes_per_room.setdefault(room, set()).add(host)
+    return {
+        'nodes': size,
+        'cpu_percent_mean': round(sum(cpu) / len(cpu), 2),
+        'cpu_percent_max': round(max(cpu), 2),
+        'messages_per_node': round(sum(r['sent'] for r in reports) / len(reports), 1),
+        'rooms_per_node': round(sum(r['rooms_hosted'] for r in reports) / len(reports), 1),
+        'nodes_per_room': round(sum(len(hosts) for hosts in nodes_per_room.values())
+                                / len(nodes_per_room), 2),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.cluster')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--modes', nargs='+', default=['broadcast', 'room-channels', 'sharded'],
+                        choices=['broadcast', 'room-channels', 'sharded'])
+    parser.add_argument('--rooms-per-node', type=int, default=10)
+    parser.add_argument('--clients-per-room', type=int, default=5)
+    parser.add_argument('--rate', type=int, default=200, help='Messages per second per node')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--output', default='bench_cluster.json')
+    args = parser.parse_args(argv)
+
+    url = PubSubBroker().start()
+    results = {}
+    for mode in args.modes:
+        results[mode] = []
+        for size in args.sizes:
+            row = run_cluster(mode, url, size, args.rooms_per_node, args.clients_per_room,
+                              args.rate, args.duration)
+            results[mode].append(row)
+            print(f"{mode:<14} nodes={size:<3} cpu/node mean={row['cpu_percent_mean']:6.2f}% "
+                  f"max={row['cpu_percent_max']:6.2f}% rooms/node={row['rooms_per_node']:<6} "
+                  f"nodes/room={row['nodes_per_room']}")
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import json
+import math
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Metrics where a larger value is a regression; everything else compared
+# is treated as higher-is-better.
+LOWER_IS_BETTER = ('p50_ms', 'p99_ms', 'mean_ms', 'cpu_ms_per_op', 'bytes_per_op')
+HIGHER_IS_BETTER = ('throughput_per_s',)
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+def rss_mb():
+    """Peak resident set size of this process in MB"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return usage / divisor
+
+class Recorder:
+    """Collects per-operation latencies for one scenario"""
+
+    def __init__(self):
+        self.samples = []
+        self.cpu_samples = []
+        self.extra = {}
+        self.started = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.rss_before = rss_mb()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.rss_after = rss_mb()
+        return False
+
+    def time(self, fn, *args, **kwargs):
+        # thread_time so concurrent workers do not bill each other's CPU
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples.append((time.perf_counter() - start) * 1000)
+        self.cpu_samples.append((time.thread_time() - cpu_start) * 1000)
+        return result
+
+    async def time_async(self, fn, *args, **kwargs):
+        # Coroutines share the loop thread, so per-op CPU is not attributable;
+        # scenarios spread the loop's total CPU over the samples instead.
+        start = time.perf_counter()
+        result = await fn(*args, **kwargs)
+        self.samples.append((time.perf_counter() - start) * 1000)
+        return result
+
+    def summary(self):
+        count = len(self.samples)
+        result = {
+            'count': count,
+            'p50_ms': round(percentile(self.samples, 50), 3),
+            'p99_ms': round(percentile(self.samples, 99), 3),
+            'mean_ms': round(sum(self.samples) / count, 3) if count else 0.0,
+            'throughput_per_s': round(count / self.elapsed, 2) if self.elapsed else 0.0,
+            'cpu_ms_per_op': round(sum(self.cpu_samples) / count, 4) if count else 0.0,
+            'rss_peak_mb': round(self.rss_after, 2),
+            'rss_delta_mb': round(self.rss_after - self.rss_before, 2),
+        }
+        result.update(self.extra)
+        return result
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def build_report(results, dataset, database_url):
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': database_url.split(':', 1)[0],
+            'dataset': dataset,
+        },
+        'scenarios': results,
+    }
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_reports(current, baseline, threshold):
+    """Return (rows, regressions) comparing scenario metrics to a baseline"""
+    rows = []
+    regressions = []
+    for name, metrics in sorted(current['scenarios'].items()):
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in metrics or not base.get(metric):
+                continue
+            change = (metrics[metric] - base[metric]) / base[metric]
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            rows.append((name, metric, base[metric], metrics[metric], change, worse))
+            if worse:
+                regressions.append((name, metric))
+    return rows, regressions
+
+def format_results(results):
+    lines = [f"{'scenario':<28}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'rss MB':>10}"]
+    for name, m in sorted(results.items()):
+        lines.append(
+            f"{name:<28}{m['count']:>8}{m['p50_ms']:>10.2f}{m['p99_ms']:>10.2f}"
+            f"{m['throughput_per_s']:>10.1f}{m['rss_peak_mb']:>10.1f}"
+        )
+    return '\n'.join(lines)
+
+def format_comparison(rows):
+    lines = [f"{'scenario':<28}{'metric':<18}{'baseline':>12}{'current':>12}{'change':>9}"]
+    for name, metric, base, cur, change, worse in rows:
+        flag = '  REGRESSION' if worse else ''
+        lines.append(f"{name:<28}{metric:<18}{base:>12.2f}{cur:>12.2f}{change:>+9.1%}{flag}")
+    return '\n'.join(lines)
@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from socketio.packet import EVENT, Packet
+from sqlalchemy import select
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import AcceptConnection, Request, TextMessage
+from wsproto.extensions import PerMessageDeflate
+
+from app import app, db, socketio, limiter
+from models import User, Message, RoomSummary, user_chatroom
+from compression import DeploymentPerMessageDeflate, compress_body
+from async_db import AsyncDatabase, app_database_url
+from benchmarks.harness import Recorder
+from benchmarks.seed import USER_PREFIX, PASSWORD
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = {}
+
+def scenario(name):
+    """Register a benchmark scenario under ``name``"""
+    def decorator(f):
+        SCENARIOS[name] = f
+        return f
+    return decorator
+
+class BenchContext:
+    """Shared options and helpers handed to every scenario"""
+
+    def __init__(self, iterations, concurrency, messages_per_client):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.messages_per_client = messages_per_client
+
+    def login(self, username):
+        client = app.test_client()
+        # Flask's test client injects REMOTE_ADDR and User-Agent that the
+        # Socket.IO test client does not, which would trip the 'strong'
+        # session protection on the handshake.
+        client.environ_base.clear()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f"Login failed for {username}: {response.status_code}")
+        return client
+
+    def socket_client(self, username):
+        client = self.login(username)
+        sio = socketio.test_client(app, flask_test_client=client)
+        if not sio.is_connected():
+            raise RuntimeError(f"Socket connection refused for {username}")
+        sio.get_received()
+        return client, sio
+
+    def member_rooms(self, count):
+        """Return up to ``count`` (username, room_id) pairs for bench users"""
+        with app.app_context():
+            rows = db.session.query(User.username, user_chatroom.c.chatroom_id).join(
+                user_chatroom, user_chatroom.c.user_id == User.id
+            ).filter(User.username.like(f'{USER_PREFIX}%')).order_by(User.id).all()
+        pairs = {}
+        for username, room_id in rows:
+            pairs.setdefault(username, room_id)
+        return list(pairs.items())[:count]
+
+    def active_room(self, username):
+        """Most recently active room the user belongs to"""
+        with app.app_context():
+            return db.session.query(RoomSummary.chatroom_id).join(
+                user_chatroom, user_chatroom.c.chatroom_id == RoomSummary.chatroom_id
+            ).join(User, User.id == user_chatroom.c.user_id).filter(
+                User.username == username
+            ).order_by(RoomSummary.last_message_at.desc()).limit(1).scalar()
+
+    def run_concurrently(self, work, items):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for future in [pool.submit(work, item) for item in items]:
+                future.result()
+
+def prepare_app():
+    """Quiet the app and lift limits so measurements reflect request cost"""
+    limiter.enabled = False
+    with app.app_context():
+        db.engine.echo = False
+
+@scenario('http_chat')
+def bench_http_chat(ctx, rec):
+    client = ctx.login(f'{USER_PREFIX}0')
+    for _ in range(ctx.iterations):
+        response = rec.time(client.get, '/chat')
+        assert response.status_code == 200, response.status_code
+
+@scenario('http_view_chat')
+def bench_http_view_chat(ctx, rec):
+    username = f'{USER_PREFIX}0'
+    room_id = ctx.active_room(username)
+    client = ctx.login(username)
+    for _ in range(ctx.iterations):
+        response = rec.time(client.get, f'/chat/{room_id}')
+        assert response.status_code == 200, response.status_code
+    rec.extra['response_bytes'] = len(response.data)
+
+@scenario('http_view_chat_conditional')
+def bench_http_view_chat_conditional(ctx, rec):
+    username = f'{USER_PREFIX}0'
+    room_id = ctx.active_room(username)
+    client = ctx.login(username)
+    etag = client.get(f'/chat/{room_id}').headers['ETag']
+    for _ in range(ctx.iterations):
+        response = rec.time(client.get, f'/chat/{room_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 304, response.status_code
+
+@scenario('http_health_ready')
+def bench_http_health_ready(ctx, rec):
+    # Served from the prober's cached snapshot; no DB or Redis round trip
+    import health
+    health.prober.probe()
+    client = app.test_client()
+    for _ in range(ctx.iterations):
+        response = rec.time(client.get, '/health/ready')
+        assert response.status_code == 200, response.status_code
+
+@scenario('socket_connect')
+def bench_socket_connect(ctx, rec):
+    client = ctx.login(f'{USER_PREFIX}0')
+    for _ in range(ctx.iterations):
+        sio = rec.time(socketio.test_client, app, flask_test_client=client)
+        sio.disconnect()
+
+@scenario('socket_join')
+def bench_socket_join(ctx, rec):
+    def work(pair):
+        username, room_id = pair
+        _, sio = ctx.socket_client(username)
+        for _ in range(ctx.messages_per_client):
+            rec.time(sio.emit, 'join', {'room': room_id})
+            sio.emit('leave', {'room': str(room_id)})
+            sio.get_received()
+        sio.disconnect()
+    ctx.run_concurrently(work, ctx.member_rooms(ctx.concurrency))
+
+@scenario('socket_send_message')
+def bench_socket_send_message(ctx, rec):
+    def work(pair):
+        username, room_id = pair
+        _, sio = ctx.socket_client(username)
+        sio.emit('join', {'room': room_id})
+        for i in range(ctx.messages_per_client):
+            rec.time(sio.emit, 'send_message', {'chat_id': room_id, 'message': f'bench {i}'})
+            sio.get_received()
+        sio.disconnect()
+    ctx.run_concurrently(work, ctx.member_rooms(ctx.concurrency))
+
+# Sync vs async data access for the hot socket operations, without the
+# Socket.IO layer. Each send is membership check + insert + summary update;
+# each history op is membership check + delta fetch of the last 50 messages.
+
+def _db_work(ctx):
+    pairs = ctx.member_rooms(ctx.concurrency)
+    with app.app_context():
+        users = dict(db.session.query(User.username, User.id).filter(
+            User.username.in_([username for username, _ in pairs])))
+        latest = dict(db.session.query(Message.chatroom_id, db.func.max(Message.id)).filter(
+            Message.chatroom_id.in_([room_id for _, room_id in pairs])
+        ).group_by(Message.chatroom_id))
+    return [(users[username], username, room_id, latest.get(room_id, 0)) for username, room_id in pairs]
+
+def _sync_op(kind, user_id, username, room_id, after, i):
+    with app.app_context():
+        if db.session.query(user_chatroom).filter_by(user_id=user_id, chatroom_id=room_id).first() is None:
+            raise RuntimeError(f"{username} is not a member of {room_id}")
+        if kind == 'send':
+            message = Message(content=f'bench {i}', sender_id=user_id, chatroom_id=room_id)
+            db.session.add(message)
+            db.session.flush()
+            db.session.execute(RoomSummary.record_statement(
+                db.engine.dialect.name, message, user_id, username
+            ))
+            db.session.commit()
+        else:
+            db.session.execute(Message.history_statement(room_id, max(after - 50, 0), 200)).all()
+
+async def _async_op(async_db, kind, user_id, username, room_id, after, i):
+    if kind == 'send':
+        await async_db.send_message(user_id, username, room_id, f'bench {i}')
+    else:
+        if not await async_db.is_member(user_id, room_id):
+            raise RuntimeError(f"{username} is not a member of {room_id}")
+        await async_db.history(room_id, max(after - 50, 0), 200)
+
+def _db_sync_scenario(kind):
+    def bench(ctx, rec):
+        def work(item):
+            for i in range(ctx.messages_per_client):
+                rec.time(_sync_op, kind, *item, i)
+        ctx.run_concurrently(work, _db_work(ctx))
+    return bench
+
+def _db_async_scenario(kind):
+    """All clients as coroutines on one event loop thread"""
+    def bench(ctx, rec):
+        items = _db_work(ctx)
+        async_db = AsyncDatabase(app_database_url(),
+                                 pool_size=ctx.concurrency, max_overflow=0)
+
+        async def client(item):
+            for i in range(ctx.messages_per_client):
+                await rec.time_async(_async_op, async_db, kind, *item, i)
+
+        async def main():
+            try:
+                await asyncio.gather(*[client(item) for item in items])
+            finally:
+                await async_db.engine.dispose()
+
+        cpu_start = time.thread_time()
+        asyncio.run(main())
+        cpu_ms = (time.thread_time() - cpu_start) * 1000
+        rec.cpu_samples = [cpu_ms / len(rec.samples)] * len(rec.samples)
+        rec.extra['threads'] = 1
+    return bench
+
+def _db_bridge_scenario(kind):
+    """Synchronous handler threads calling through AsyncDatabase.run"""
+    def bench(ctx, rec):
+        items = _db_work(ctx)
+        async_db = AsyncDatabase(app_database_url(),
+                                 pool_size=ctx.concurrency, max_overflow=0)
+        def work(item):
+            for i in range(ctx.messages_per_client):
+                rec.time(lambda: async_db.run(_async_op(async_db, kind, *item, i)))
+        try:
+            ctx.run_concurrently(work, items)
+        finally:
+            async_db.dispose()
+    return bench
+
+for _kind in ('send', 'history'):
+    scenario(f'db_{_kind}_sync')(_db_sync_scenario(_kind))
+    scenario(f'db_{_kind}_async')(_db_async_scenario(_kind))
+    scenario(f'db_{_kind}_async_bridge')(_db_bridge_scenario(_kind))
+
+def _http_page_scenario(encoding):
+    def bench(ctx, rec):
+        username = f'{USER_PREFIX}0'
+        room_id = ctx.active_room(username)
+        client = ctx.login(username)
+        wire = 0
+        for _ in range(ctx.iterations):
+            response = rec.time(client.get, f'/chat/{room_id}', headers={'Accept-Encoding': encoding})
+            assert response.status_code == 200, response.status_code
+            wire += len(response.data)
+        rec.extra['bytes_per_op'] = round(wire / ctx.iterations, 1)
+        rec.extra['content_encoding'] = response.headers.get('Content-Encoding')
+    return bench
+
+def _dynamic_compression_scenario(algorithm):
+    def bench(ctx, rec):
+        username = f'{USER_PREFIX}0'
+        room_id = ctx.active_room(username)
+        client = ctx.login(username)
+        body = client.get(f'/chat/{room_id}', headers={'Accept-Encoding': 'identity'}).data
+        level = {
+            'zstd': app.config['COMPRESS_ZSTD_LEVEL'],
+            'br': app.config['COMPRESS_BR_LEVEL'],
+            'gzip': app.config['COMPRESS_LEVEL'],
+        }[algorithm]
+        for _ in range(ctx.iterations):
+            compressed = rec.time(compress_body, body, algorithm, level)
+        rec.extra['raw_bytes_per_op'] = len(body)
+        rec.extra['bytes_per_op'] = len(compressed)
+    return bench
+
+for _encoding in ('identity', 'gzip', 'br', 'zstd'):
+    scenario(f'http_page_{_encoding}')(_http_page_scenario(_encoding))
+for _algorithm in ('gzip', 'br', 'zstd'):
+    scenario(f'compress_dynamic_{_algorithm}')(_dynamic_compression_scenario(_algorithm))
+
+def socketio_frames(count):
+    """Recent messages encoded as the new_message packets the server emits"""
+    with app.test_request_context():
+        rows = db.session.execute(
+            select(Message, User.username).join(User, User.id == Message.sender_id)
+            .order_by(Message.id.desc()).limit(count)
+        ).all()
+        # Engine.IO MESSAGE ("4") wrapping a Socket.IO EVENT packet
+        return [('4' + Packet(EVENT, data=['new_message', message.to_dict(username)]).encode()).encode()
+                for message, username in reversed(rows)]
+
+def websocket_pair(compression, context_takeover):
+    """Handshaked wsproto server/client pair negotiated the way the server does.
+
+    The client offers permessage-deflate like a browser; the server accepts
+    it through DeploymentPerMessageDeflate, as simple-websocket does.
+    """
+    overrides = {'WS_COMPRESSION': compression, 'WS_CONTEXT_TAKEOVER': context_takeover}
+    saved = {key: app.config[key] for key in overrides}
+    app.config.update(overrides)
+    try:
+        server = WSConnection(ConnectionType.SERVER)
+        client = WSConnection(ConnectionType.CLIENT)
+        server.receive_data(client.send(Request(host='bench', target='/socket.io/',
+                                                extensions=[PerMessageDeflate()])))
+        for event in server.events():
+            if isinstance(event, Request):
+                client.receive_data(server.send(AcceptConnection(
+                    extensions=[DeploymentPerMessageDeflate()])))
+        list(client.events())
+    finally:
+        app.config.update(saved)
+    return server, client
+
+def _websocket_scenario(compression, context_takeover=False):
+    def bench(ctx, rec):
+        frames = socketio_frames(ctx.iterations * 10)
+        server, client = websocket_pair(compression, context_takeover)
+        wire = raw = 0
+        for frame in frames:
+            data = rec.time(server.send, TextMessage(data=frame.decode()))
+            client.receive_data(data)
+            received = ''.join(event.data for event in client.events())
+            if received.encode() != frame:
+                raise RuntimeError('websocket frame did not round-trip')
+            raw += len(frame)
+            wire += len(data)
+        rec.extra['raw_bytes_per_op'] = round(raw / len(frames), 1) if frames else 0
+        rec.extra['bytes_per_op'] = round(wire / len(frames), 1) if frames else 0
+    return bench
+
+scenario('ws_frames_uncompressed')(_websocket_scenario(False))
+scenario('ws_frames_deflate_takeover')(_websocket_scenario(True, context_takeover=True))
+scenario('ws_frames_deflate_no_takeover')(_websocket_scenario(True))
+
+@scenario('compress_min_size')
+def bench_compress_min_size(ctx, rec):
+    """Bytes saved per algorithm for chat JSON payloads of growing size"""
+    frames = b'[' + b','.join(socketio_frames(200)) + b']'
+    savings = {}
+    for size in (128, 256, 384, 512, 768, 1024, 1500, 2048, 4096):
+        payload = frames[:size]
+        savings[size] = {}
+        for algorithm, level in (('gzip', app.config['COMPRESS_LEVEL']),
+                                 ('br', app.config['COMPRESS_BR_LEVEL']),
+                                 ('zstd', app.config['COMPRESS_ZSTD_LEVEL'])):
+            compressed = rec.time(compress_body, payload, algorithm, level)
+            savings[size][algorithm] = len(payload) - len(compressed)
+    rec.extra['bytes_saved_by_size'] = savings
+
+def run_scenarios(names, ctx):
+    prepare_app()
+    results = {}
+    for name in names:
+        logger.warning(f"Running scenario {name}")
+        with Recorder() as rec:
+            SCENARIOS[name](ctx, rec)
+        results[name] = rec.summary()
+    return results
@@ -0,0 +1,118 @@
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app import app, db, cache
+from models import User, ChatRoom, Message, RoomSummary, user_chatroom
+
+logger = logging.getLogger(__name__)
+
+USER_PREFIX = 'bench_user_'
+ROOM_PREFIX = 'bench_room_'
+PASSWORD = 'bench'
+BATCH_SIZE = 10000
+
+def bench_usernames(count):
+    return [f'{USER_PREFIX}{i}' for i in range(count)]
+
+def bench_rooms():
+    return db.session.query(ChatRoom.id).filter(ChatRoom.name.like(f'{ROOM_PREFIX}%'))
+
+def is_seeded(users, rooms, messages):
+    """True when the bench rows match the requested size exactly"""
+    with app.app_context():
+        return (
+            User.query.filter(User.username.like(f'{USER_PREFIX}%')).count() >= users
+            and bench_rooms().count() == rooms
+            and Message.query.filter(Message.chatroom_id.in_(bench_rooms())).count() == messages
+        )
+
+def clear_bench_rooms():
+    """Delete bench rooms with their messages, memberships and summaries"""
+    room_ids = bench_rooms().scalar_subquery()
+    RoomSummary.query.filter(RoomSummary.chatroom_id.in_(room_ids)).delete(synchronize_session=False)
+    Message.query.filter(Message.chatroom_id.in_(room_ids)).delete(synchronize_session=False)
+    db.session.execute(user_chatroom.delete().where(user_chatroom.c.chatroom_id.in_(room_ids)))
+    ChatRoom.query.filter(ChatRoom.name.like(f'{ROOM_PREFIX}%')).delete(synchronize_session=False)
+    db.session.commit()
+
+def seed(users, rooms, messages, members_per_room=5, seed_value=1):
+    """Bulk insert synthetic users, rooms, memberships and messages.
+
+    Bench users are topped up; bench rooms and their messages are wiped and
+    re-seeded so a rerun with other sizes never duplicates them.
+    """
+    rng = random.Random(seed_value)
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        clear_bench_rooms()
+        password_hash = generate_password_hash(PASSWORD)
+        existing = {
+            name for (name,) in db.session.query(User.username)
+            .filter(User.username.like(f'{USER_PREFIX}%'))
+        }
+        new_users = [
+            {'username': name, 'password_hash': password_hash}
+            for name in bench_usernames(users) if name not in existing
+        ]
+        if new_users:
+            db.session.execute(insert(User), new_users)
+        # Only the first ``users`` bench users, so a smaller rerun stays that size
+        wanted = set(bench_usernames(users))
+        user_ids = [
+            user_id for (user_id, name) in db.session.query(User.id, User.username)
+            .filter(User.username.like(f'{USER_PREFIX}%')).order_by(User.id)
+            if name in wanted
+        ]
+
+        room_ids = []
+        memberships = []
+        for i in range(rooms):
+            size = min(len(user_ids), max(2, rng.randint(2, members_per_room)))
+            room = ChatRoom(name=f'{ROOM_PREFIX}{i}', is_group=size > 2)
+            db.session.add(room)
+            db.session.flush()
+            room_ids.append(room.id)
+            # Every bench user belongs to the first room so HTTP scenarios
+            # always have a room to open.
+            members = set(rng.sample(user_ids, size))
+            members.add(user_ids[0])
+            memberships.extend({'user_id': u, 'chatroom_id': room.id} for u in members)
+        if memberships:
+            db.session.execute(insert(user_chatroom), memberships)
+        db.session.commit()
+
+        members_by_room = {}
+        for row in memberships:
+            members_by_room.setdefault(row['chatroom_id'], []).append(row['user_id'])
+
+        start_time = datetime.utcnow() - timedelta(seconds=messages)
+        batch = []
+        for i in range(messages):
+            room_id = rng.choice(room_ids)
+            batch.append({
+                'content': f'benchmark message {i} ' + 'lorem ipsum ' * rng.randint(1, 8),
+                'message_type': 'text',
+                'timestamp': start_time + timedelta(seconds=i),
+                'sender_id': rng.choice(members_by_room[room_id]),
+                'chatroom_id': room_id,
+            })
+            if len(batch) >= BATCH_SIZE:
+                db.session.execute(insert(Message), batch)
+                db.session.commit()
+                batch = []
+        if batch:
+            db.session.execute(insert(Message), batch)
+            db.session.commit()
+
+        RoomSummary.rebuild()
+        cache.clear()
+    logger.warning(
+        f"Seeded {len(new_users)} users, {rooms} rooms and {messages} messages "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
@@ -1,8 +1,10 @@
 from flask_socketio import emit, join_room, leave_room
 from flask_login import current_user
-from flask import current_app, url_for
+from flask import current_app
 from app import socketio, db
-from models import Message, ChatRoom, User
+from models import Message, ChatRoom, User, RoomSummary, user_chatroom
+from page_cache import room_version, user_rooms_version, bump_versions
+from async_db import get_async_db
 import logging
 from datetime import datetime
 
@@ -64,16 +66,31 @@ def on_join(data):
                 logger.warning(f"User {current_user.username} attempted to join unauthorized notification room {room}")
                 return False
         else:
-            chatroom = ChatRoom.query.get(room)
-            if chatroom and current_user in chatroom.users:
-                room_id = str(room)
+            try:
+                chatroom_id = int(room)
+            except (TypeError, ValueError):
+                logger.warning(f"User {current_user.username} sent an invalid chat room id {room!r}")
+                return False
+            if current_app.config['SOCKETIO_ASYNC_DB']:
+                async_db = get_async_db()
+                allowed = async_db.run(async_db.is_member(current_user.id, chatroom_id))
+            else:
+                chatroom = ChatRoom.query.get(chatroom_id)
+                allowed = chatroom is not None and current_user in chatroom.users
+            if allowed:
+                room_id = str(chatroom_id)
                 join_room(room_id)
                 logger.info(f"User {current_user.username} joined chat room {room_id}")
-                emit('room_joined', {
+                joined = {
                     'room': room_id,
                     'type': 'chat',
                     'timestamp': datetime.now().strftime('%H:%M')
-                })
+                }
+                manager = socketio.server.manager
+                if hasattr(manager, 'node_for'):
+                    # The client reconnects to the owner when it is elsewhere
+                    joined.update(node=manager.node_for(room_id), current_node=manager.node_id)
+                emit('room_joined', joined)
                 return True
             else:
                 logger.warning(f"User {current_user.username} attempted to join unauthorized chat room {room}")
@@ -103,6 +120,19 @@ def on_leave(data):
         emit('error', {'message': error_msg}, room=f'user_{current_user.id}')
         return False
 
+def store_message(chat_id, fields):
+    """Synchronous counterpart of AsyncDatabase.send_message"""
+    chatroom = ChatRoom.query.get(chat_id)
+    if not chatroom or current_user not in chatroom.users:
+        raise ValueError("Invalid chat room or unauthorized access")
+    
+    message = Message(sender_id=current_user.id, chatroom_id=chatroom.id, **fields)
+    db.session.add(message)
+    db.session.flush()
+    RoomSummary.record_message(message, current_user)
+    db.session.commit()
+    return message, chatroom.name, [user.id for user in chatroom.users]
+
 @socketio.on('send_message')
 def handle_message(data):
     try:
@@ -112,48 +142,39 @@ def handle_message(data):
         chat_id = data.get('chat_id')
         if not chat_id:
             raise ValueError("No chat ID provided")
-        
-        chatroom = ChatRoom.query.get(chat_id)
-        if not chatroom or current_user not in chatroom.users:
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
             raise ValueError("Invalid chat room or unauthorized access")
         
-        message_content = data.get('message', '').strip()
-        message_type = data.get('message_type', 'text')
-        file_path = data.get('file_path')
-        file_name = data.get('file_name')
-        
-        # Create and save message
-        message = Message(
-            content=message_content,
-            message_type=message_type,
-            file_path=file_path,
-            file_name=file_name,
-            sender_id=current_user.id,
-            chatroom_id=chat_id
-        )
+        fields = {
+            'content': data.get('message', '').strip(),
+            'message_type': data.get('message_type', 'text'),
+            'file_path': data.get('file_path'),
+            'file_name': data.get('file_name')
+        }
         
-        db.session.add(message)
-        db.session.commit()
+        if current_app.config['SOCKETIO_ASYNC_DB']:
+            async_db = get_async_db()
+            message, room_name, member_ids = async_db.run(async_db.send_message(
+                current_user.id, current_user.username, chat_id, **fields
+            ))
+        else:
+            message, room_name, member_ids = store_message(chat_id, fields)
+        bump_versions(room_version(message.chatroom_id),
+                      *[user_rooms_version(user_id) for user_id in member_ids])
         
         logger.info(f"Message sent by {current_user.username} in chat {chat_id}")
         
         # Prepare message data for chat room
-        message_data = {
-            'message': message.content,
-            'message_type': message.message_type,
-            'file_path': url_for('static', filename=file_path) if file_path else None,
-            'file_name': file_name,
-            'username': current_user.username,
-            'sender_id': current_user.id,
-            'timestamp': message.timestamp.strftime('%H:%M')
-        }
+        message_data = message.to_dict(current_user.username)
         
         # Emit message to chat room
         emit('new_message', message_data, room=str(chat_id))
         
         # Prepare and send notifications to other users
         notification_data = {
-            'message': f'New message from {current_user.username} in {chatroom.name}',
+            'message': f'New message from {current_user.username} in {room_name}',
             'timestamp': datetime.now().strftime('%H:%M'),
             'chat_id': chat_id,
             'sender_id': current_user.id,
@@ -161,10 +182,10 @@ def handle_message(data):
         }
         
         # Send notifications to all users in the chat except sender
-        for user in chatroom.users:
-            if user.id != current_user.id:
-                user_room = f'user_{user.id}'
-                logger.info(f"Sending notification to user {user.username} in room {user_room}")
+        for user_id in member_ids:
+            if user_id != current_user.id:
+                user_room = f'user_{user_id}'
+                logger.info(f"Sending notification to user {user_id} in room {user_room}")
                 emit('new_notification', notification_data, room=user_room)
         
         return True
@@ -175,3 +196,44 @@ def handle_message(data):
         db.session.rollback()
         emit('error', {'message': error_msg}, room=f'user_{current_user.id}')
         return False
+
+@socketio.on('history')
+def handle_history(data):
+    """Acknowledge with one history page (the socket twin of chat_history)"""
+    try:
+        if not current_user.is_authenticated:
+            return False
+        
+        chat_id = int(data.get('chat_id'))
+        after = data.get('after')
+        after = int(after) if after is not None else None
+        before = data.get('before')
+        before = int(before) if before is not None else None
+        limit = max(1, min(int(data.get('limit', 200)), 500))
+        
+        if current_app.config['SOCKETIO_ASYNC_DB']:
+            async_db = get_async_db()
+            if not async_db.run(async_db.is_member(current_user.id, chat_id)):
+                return False
+            rows, has_more = async_db.run(async_db.history(chat_id, after, limit, before))
+        else:
+            if db.session.query(user_chatroom).filter_by(
+                    user_id=current_user.id, chatroom_id=chat_id).first() is None:
+                return False
+            rows, has_more = Message.history_page(
+                db.session.execute(Message.history_statement(chat_id, after, limit, before)).all(),
+                after, limit
+            )
+        
+        return {
+            'chat_id': chat_id,
+            'messages': [message.to_dict(username) for message, username in rows],
+            'has_more': has_more
+        }
+        
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Error fetching history: {error_msg}")
+        db.session.rollback()
+        emit('error', {'message': error_msg}, room=f'user_{current_user.id}')
+        return False
@@ -0,0 +1,120 @@
+import gzip
+import logging
+import os
+from functools import lru_cache
+
+import brotli
+import simple_websocket.ws
+import zstandard
+from flask import request, make_response
+from wsproto.extensions import PerMessageDeflate
+
+from app import app, cache
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=128)
+def choose_encoding(accept_encoding, algorithms):
+    """Pick the client's highest-q encoding, breaking ties in server order"""
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                pass
+        if name:
+            accepted[name.strip()] = quality
+    best, best_quality = None, 0.0
+    for algorithm in algorithms:
+        quality = accepted.get(algorithm, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = algorithm, quality
+    return best
+
+def compress_body(data, algorithm, level):
+    if algorithm == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if algorithm == 'br':
+        return brotli.compress(data, quality=level)
+    if algorithm == 'gzip':
+        return gzip.compress(data, compresslevel=level)
+    raise ValueError(f"Unsupported encoding: {algorithm}")
+
+# Runs before Flask-Compress's hook (after_request hooks run in reverse
+# registration order), so static assets are compressed once at the high
+# static levels and Flask-Compress skips them because Content-Encoding is set.
+@app.after_request
+def compress_static(response):
+    if request.endpoint != 'static' or response.status_code != 200:
+        return response
+    if response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+        return response
+
+    etag, _ = response.get_etag()
+    # Clients revalidate with the encoded ETag we hand out below
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if etag and tag.split(':', 1)[0] == etag:
+            not_modified = make_response('', 304)
+            not_modified.headers['Cache-Control'] = response.headers.get('Cache-Control', '')
+            not_modified.headers['Vary'] = 'Accept-Encoding'
+            not_modified.set_etag(tag)
+            return not_modified
+
+    levels = app.config['COMPRESS_STATIC_LEVELS']
+    algorithm = choose_encoding(request.headers.get('Accept-Encoding', ''), tuple(levels))
+    filename = request.view_args.get('filename', '')
+    try:
+        stat = os.stat(os.path.join(app.static_folder, filename))
+    except OSError:
+        return response
+    if algorithm is None or stat.st_size < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    key = f'static:{algorithm}:{filename}:{stat.st_mtime}'
+    body = cache.get(key)
+    response.direct_passthrough = False
+    if body is None:
+        body = compress_body(response.get_data(), algorithm, levels[algorithm])
+        cache.set(key, body, timeout=app.config['SEND_FILE_MAX_AGE_DEFAULT'])
+    elif hasattr(response.response, 'close'):
+        response.call_on_close(response.response.close)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = algorithm
+    response.headers['Vary'] = 'Accept-Encoding'
+    if etag:
+        response.set_etag(f'{etag}:{algorithm}')
+    return response
+
+class DeploymentPerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate negotiated with the deployment's WS_* settings"""
+
+    def __init__(self):
+        super().__init__(
+            server_no_context_takeover=not app.config['WS_CONTEXT_TAKEOVER'],
+            server_max_window_bits=app.config['WS_MAX_WINDOW_BITS'],
+        )
+
+    def accept(self, offer):
+        if not app.config['WS_COMPRESSION']:
+            return None
+        return super().accept(offer)
+
+def configure_websocket_compression():
+    """Apply WS_* settings to the threading-mode websocket server"""
+    if app.config['SOCKETIO_ASYNC_MODE'] != 'threading':
+        logger.info("Websocket compression settings only apply to threading mode")
+        return
+    # simple-websocket builds its accepted extensions from this module
+    # global on every handshake; there is no constructor option for it.
+    simple_websocket.ws.PerMessageDeflate = DeploymentPerMessageDeflate
+    logger.info(
+        f"Websocket permessage-deflate {'enabled' if app.config['WS_COMPRESSION'] else 'disabled'}, "
+        f"context takeover {app.config['WS_CONTEXT_TAKEOVER']}, "
+        f"window bits {app.config['WS_MAX_WINDOW_BITS']}"
+    )
+
+configure_websocket_compression()
@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+import redis
+from flask import jsonify
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from app import app, db, socketio, limiter, REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+VERSION = '1.0.0'
+
+class HealthProber:
+    """Background thread that probes dependencies and caches the results.
+
+    Health endpoints only read ``snapshot``, so load balancer polling costs
+    no database or Redis round trips and a slow dependency cannot pile up
+    request threads. A probe that hangs simply stops refreshing the
+    snapshot, which readiness reports as stale.
+    """
+
+    def __init__(self, app, interval=5, timeout=2, stale_after=None, pool_saturation_limit=0.95,
+                 fail_on_pool_saturation=False):
+        self.app = app
+        self.interval = interval
+        self.stale_after = stale_after or 3 * interval
+        self.pool_saturation_limit = pool_saturation_limit
+        self.fail_on_pool_saturation = fail_on_pool_saturation
+        self.timeout = timeout
+        self._engine = None
+        self.redis = None
+        if REDIS_URL:
+            self.redis = redis.from_url(REDIS_URL, socket_timeout=timeout,
+                                        socket_connect_timeout=timeout)
+        self.snapshot = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='health-prober', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
+
+    @staticmethod
+    def _timed(check):
+        started = time.perf_counter()
+        try:
+            detail = check() or {}
+            status = 'ok'
+        except Exception as e:
+            detail = {'error': str(e)}
+            status = 'down'
+        return dict(status=status, latency_ms=round((time.perf_counter() - started) * 1000, 2), **detail)
+
+    def _probe_engine(self):
+        # A separate unpooled engine: probing through the app pool would wait
+        # for pool_timeout whenever the pool is busy and report a saturated
+        # but healthy database as down.
+        if self._engine is None:
+            with self.app.app_context():
+                url = db.engine.url
+            if url.get_backend_name() == 'postgresql':
+                connect_args = {
+                    'connect_timeout': max(1, round(self.timeout)),
+                    'options': f'-c statement_timeout={int(self.timeout * 1000)}',
+                }
+            elif url.get_backend_name() == 'sqlite':
+                connect_args = {'timeout': self.timeout}
+            else:
+                connect_args = {}
+            self._engine = create_engine(url, poolclass=NullPool, connect_args=connect_args)
+        return self._engine
+
+    def _check_database(self):
+        with self._probe_engine().connect() as connection:
+            connection.execute(text('SELECT 1'))
+
+    def _check_redis(self):
+        self.redis.ping()
+
+    def _pool_stats(self):
+        with self.app.app_context():
+            pool = db.engine.pool
+        if not hasattr(pool, 'checkedout') or not hasattr(pool, 'size'):
+            return {'type': type(pool).__name__}
+        capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+        checked_out = pool.checkedout()
+        return {
+            'type': type(pool).__name__,
+            'size': pool.size(),
+            'checked_out': checked_out,
+            'overflow': pool.overflow(),
+            'capacity': capacity,
+            'saturation': round(checked_out / capacity, 3) if capacity else 0.0,
+        }
+
+    def _socket_stats(self):
+        server = socketio.server
+        if server is None:
+            return {}
+        sockets = list(server.eio.sockets.values())
+        depths = [socket.queue.qsize() for socket in sockets]
+        manager = server.manager
+        return {
+            'connections': len(sockets),
+            'rooms': sum(len(rooms) for rooms in list(manager.rooms.values())),
+            'outbound_queue_total': sum(depths),
+            'outbound_queue_max': max(depths, default=0),
+        }
+
+    def probe(self):
+        components = {'database': self._timed(self._check_database)}
+        if self.redis is not None:
+            components['redis'] = self._timed(self._check_redis)
+        snapshot = {'components': components, 'checked_at': time.time()}
+        for name, collect in (('pool', self._pool_stats), ('socketio', self._socket_stats)):
+            try:
+                snapshot[name] = collect()
+            except Exception as e:
+                snapshot[name] = {'error': str(e)}
+        previous = (self.snapshot or {}).get('components', {})
+        for name, component in components.items():
+            if previous.get(name, {}).get('status', 'ok') != component['status']:
+                logger.warning(f"Health probe: {name} is {component['status']} "
+                               f"{component.get('error', '')}".rstrip())
+        # Replaced in one assignment so readers never see a partial snapshot
+        self.snapshot = snapshot
+        return snapshot
+
+    def readiness(self):
+        """Return (ready, payload) built from the cached snapshot only"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return False, {'status': 'starting'}
+        age = time.time() - snapshot['checked_at']
+        reasons = [f"{name} {component['status']}"
+                   for name, component in snapshot['components'].items()
+                   if component['status'] != 'ok']
+        if age > self.stale_after:
+            reasons.append('probe stale')
+        warnings = []
+        if snapshot['pool'].get('saturation', 0) >= self.pool_saturation_limit:
+            (reasons if self.fail_on_pool_saturation else warnings).append('database pool saturated')
+        payload = dict(snapshot, status='ready' if not reasons else 'unavailable',
+                       reasons=reasons, warnings=warnings, age_s=round(age, 2))
+        return not reasons, payload
+
+prober = HealthProber(
+    app,
+    interval=app.config['HEALTH_PROBE_INTERVAL'],
+    timeout=app.config['HEALTH_PROBE_TIMEOUT'],
+    pool_saturation_limit=app.config['HEALTH_POOL_SATURATION_LIMIT'],
+    fail_on_pool_saturation=app.config['HEALTH_FAIL_ON_POOL_SATURATION'],
+)
+
+def _no_store(response, status=200):
+    response.status_code = status
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/health/live')
+@limiter.exempt
+def liveness():
+    """The process is up and serving requests; dependencies are not checked"""
+    return _no_store(jsonify({
+        'status': 'alive',
+        'prober': 'running' if prober.alive() else 'stopped',
+        'version': VERSION,
+        'uptime': time.time() - app.start_time
+    }))
+
+@app.route('/health/ready')
+@app.route('/health')
+@limiter.exempt
+def readiness():
+    """Dependency status from the last background probe"""
+    ready, payload = prober.readiness()
+    payload.update({
+        'version': VERSION,
+        'timestamp': datetime.now().isoformat(),
+        'uptime': time.time() - app.start_time
+    })
+    return _no_store(jsonify(payload), 200 if ready else 503)
+
+prober.start()
@@ -60,6 +60,12 @@ def signal_handler(sig, frame):
         with app.app_context():
             db.session.remove()
             cache.clear()
+        # Write out queued session expiry extensions
+        app.session_interface.flush()
+        # Let other nodes take over this node's rooms right away
+        manager = socketio.server.manager
+        if hasattr(manager, 'shutdown'):
+            manager.shutdown()
     except Exception as e:
         logger.error(f"Error during shutdown: {str(e)}")
     sys.exit(0)
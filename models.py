@@ -1,8 +1,11 @@
 from datetime import datetime
+from flask import url_for
 from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import Index
+from sqlalchemy import Index, case, func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
@@ -34,6 +37,8 @@ class ChatRoom(db.Model):
     users = db.relationship('User', secondary='user_chatroom', back_populates='chatrooms')
     messages = db.relationship('Message', backref='chatroom', lazy='dynamic',
                              cascade='all, delete-orphan')
+    summary = db.relationship('RoomSummary', uselist=False, back_populates='chatroom',
+                            cascade='all, delete-orphan')
 
 class Message(db.Model):
     __tablename__ = 'message'
@@ -48,8 +53,151 @@ class Message(db.Model):
 
     __table_args__ = (
         Index('idx_message_chatroom_timestamp', 'chatroom_id', 'timestamp'),
+        Index('idx_message_chatroom_id', 'chatroom_id', 'id'),
     )
 
+    def to_dict(self, username):
+        """Payload shared by the new_message event and the history API"""
+        return {
+            'id': self.id,
+            'chat_id': self.chatroom_id,
+            'message': self.content,
+            'message_type': self.message_type,
+            'file_path': url_for('static', filename=self.file_path) if self.file_path else None,
+            'file_name': self.file_name,
+            'username': username,
+            'sender_id': self.sender_id,
+            'timestamp': self.timestamp.strftime('%H:%M'),
+            'created_at': self.timestamp.isoformat()
+        }
+
+    @classmethod
+    def history_statement(cls, chatroom_id, after=None, limit=200, before=None):
+        """Select (Message, username) for one history page, fetching one extra row
+        so ``history_page`` can tell whether more remain.
+
+        ``after`` pages forward from a message id; otherwise the page ends at
+        the latest message, or just below ``before`` when it is given.
+        """
+        stmt = select(cls, User.username).join(User, User.id == cls.sender_id).where(
+            cls.chatroom_id == chatroom_id
+        )
+        if after is not None:
+            return stmt.where(cls.id > after).order_by(cls.id).limit(limit + 1)
+        if before is not None:
+            stmt = stmt.where(cls.id < before)
+        return stmt.order_by(cls.id.desc()).limit(limit + 1)
+
+    @staticmethod
+    def history_page(rows, after, limit):
+        """Trim rows from ``history_statement`` to (oldest-first rows, has_more)"""
+        rows = list(rows)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after is None:
+            rows.reverse()
+        return rows, has_more
+
+class RoomSummary(db.Model):
+    """Denormalized per-room activity used to render the chat list.
+
+    Maintained by ``record_message`` in the same transaction as the message
+    insert, and rebuilt from ``message`` by ``rebuild``.
+    """
+    __tablename__ = 'room_summary'
+    SNIPPET_LENGTH = 100
+
+    chatroom_id = db.Column(db.Integer, db.ForeignKey('chat_room.id', ondelete='CASCADE'), primary_key=True)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='SET NULL'))
+    last_message_snippet = db.Column(db.String(SNIPPET_LENGTH))
+    last_sender_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    last_sender_username = db.Column(db.String(64))
+    last_message_at = db.Column(db.DateTime)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    chatroom = db.relationship('ChatRoom', back_populates='summary')
+
+    __table_args__ = (
+        Index('idx_room_summary_last_message_at', 'last_message_at'),
+    )
+
+    @classmethod
+    def snippet_for(cls, message):
+        text = message.content or message.file_name or message.message_type or ''
+        return text[:cls.SNIPPET_LENGTH]
+
+    @classmethod
+    def summary_values(cls, message, sender_id, sender_username):
+        return {
+            'last_message_id': message.id,
+            'last_message_snippet': cls.snippet_for(message),
+            'last_sender_id': sender_id,
+            'last_sender_username': sender_username,
+            'last_message_at': message.timestamp,
+        }
+
+    @classmethod
+    def record_statement(cls, dialect_name, message, sender_id, sender_username):
+        """Upsert that bumps the count and only moves the last-message columns forward.
+
+        A single INSERT ... ON CONFLICT DO UPDATE, so concurrent first
+        messages in a room without a summary row cannot collide.
+        """
+        inserts = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+        if dialect_name not in inserts:
+            raise ValueError(f"Room summaries need PostgreSQL or SQLite, not {dialect_name}")
+        values = cls.summary_values(message, sender_id, sender_username)
+        newer = cls.last_message_id.is_(None) | (cls.last_message_id < message.id)
+        return inserts[dialect_name](cls).values(
+            chatroom_id=message.chatroom_id, message_count=1, **values
+        ).on_conflict_do_update(
+            index_elements=[cls.chatroom_id],
+            set_=dict(message_count=cls.message_count + 1,
+                      **{k: case((newer, v), else_=getattr(cls, k)) for k, v in values.items()})
+        )
+
+    @classmethod
+    def record_message(cls, message, sender):
+        """Fold a flushed message into its room summary without committing."""
+        db.session.execute(cls.record_statement(
+            db.session.get_bind().dialect.name, message, sender.id, sender.username
+        ))
+
+    @classmethod
+    def rebuild(cls, chatroom_id=None):
+        """Recompute summaries from the message table and commit."""
+        counts = db.session.query(
+            Message.chatroom_id,
+            func.count(Message.id).label('message_count'),
+            func.max(Message.id).label('last_message_id')
+        ).group_by(Message.chatroom_id)
+        if chatroom_id is not None:
+            counts = counts.filter(Message.chatroom_id == chatroom_id)
+        counts = counts.subquery()
+
+        rows = db.session.query(Message, User.username, counts.c.message_count).join(
+            counts, Message.id == counts.c.last_message_id
+        ).join(User, User.id == Message.sender_id)
+
+        stale = db.session.query(cls)
+        if chatroom_id is not None:
+            stale = stale.filter(cls.chatroom_id == chatroom_id)
+        stale.delete()
+
+        rebuilt = 0
+        for message, username, message_count in rows.all():
+            db.session.add(cls(
+                chatroom_id=message.chatroom_id,
+                last_message_id=message.id,
+                last_message_snippet=cls.snippet_for(message),
+                last_sender_id=message.sender_id,
+                last_sender_username=username,
+                last_message_at=message.timestamp,
+                message_count=message_count
+            ))
+            rebuilt += 1
+        db.session.commit()
+        return rebuilt
+
 @login_manager.user_loader
 def load_user(id):
     return User.query.get(int(id))
@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import time
+from flask import g, request, make_response
+from app import app, cache
+
+logger = logging.getLogger(__name__)
+
+# Version counters are bumped on writes; every fragment key, ETag and
+# compressed-body key embeds the versions it was rendered from, so a bump
+# invalidates them without deleting anything.
+USERS_VERSION = 'ver:users'
+
+def room_version(room_id):
+    return f'ver:room:{room_id}'
+
+def user_rooms_version(user_id):
+    return f'ver:user_rooms:{user_id}'
+
+def _template_release():
+    """Newest template mtime, so a deploy changes every ETag"""
+    latest = 0
+    for root, dirs, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+        for fname in files:
+            latest = max(latest, os.path.getmtime(os.path.join(root, fname)))
+    return str(int(latest))
+
+TEMPLATE_RELEASE = _template_release()
+
+def _redis_client():
+    """The cache's Redis client and key prefix, or (None, None) for other backends"""
+    backend = cache.cache
+    client = getattr(backend, '_write_client', None)
+    return client, getattr(backend, 'key_prefix', '') if client is not None else None
+
+def _seed_value():
+    # Start from the clock rather than 0 so a counter that was evicted
+    # never comes back at a value an older fragment was keyed on.
+    return int(time.time() * 1000)
+
+def get_versions(*names):
+    """Fetch version counters, seeding missing ones with a fresh value"""
+    values = dict(zip(names, cache.get_many(*names)))
+    missing = [name for name, value in values.items() if value is None]
+    if missing:
+        client, prefix = _redis_client()
+        if client is not None:
+            # Plain integers rather than cachelib's pickled values, so INCR works
+            pipe = client.pipeline(transaction=False)
+            for name in missing:
+                pipe.set(prefix + name, _seed_value(), nx=True)
+            pipe.execute()
+        else:
+            for name in missing:
+                cache.add(name, _seed_value(), timeout=0)
+        values.update(zip(missing, cache.get_many(*missing)))
+    return values
+
+def bump_versions(*names):
+    """Increment counters; on Redis all of them in one round trip.
+
+    Callers bump after their write has committed, so a cache failure is
+    logged rather than raised: the write stands, and pages keyed on the old
+    versions go stale until FRAGMENT_CACHE_TIMEOUT / PAGE_CACHE_TIMEOUT.
+    """
+    try:
+        client, prefix = _redis_client()
+        if client is None:
+            get_versions(*names)
+            for name in names:
+                cache.cache.inc(name)
+            return
+        pipe = client.pipeline(transaction=False)
+        for name in names:
+            pipe.set(prefix + name, _seed_value(), nx=True)
+            pipe.incr(prefix + name)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error bumping page versions: {str(e)}")
+
+class DeferredRows:
+    """Query results fetched on first use.
+
+    Pass to templates for data only read inside a ``{% cache %}`` fragment:
+    a fragment cache hit then never runs the query. Unlike a bare Query it
+    runs once however many fragments read it, and is falsy when empty.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self._rows = None
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = self.query.all()
+        return self._rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+def page_versions(user_id, room_id=None):
+    names = [USERS_VERSION, user_rooms_version(user_id)]
+    if room_id is not None:
+        names.append(room_version(room_id))
+    versions = get_versions(*names)
+    # Strings, since they double as template fragment key parts
+    return {
+        'users': str(versions[USERS_VERSION]),
+        'rooms': str(versions[user_rooms_version(user_id)]),
+        'room': str(versions[room_version(room_id)]) if room_id is not None else '',
+    }
+
+def page_etag(user_id, room_id, versions, shell=False):
+    parts = [TEMPLATE_RELEASE, user_id, room_id, versions['users'], versions['rooms'],
+             'shell' if shell else versions['room']]
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode()).hexdigest()[:24]
+
+def not_modified(etag):
+    """Return a 304 when the client already holds ``etag``, else None"""
+    # Flask-Compress suffixes strong ETags with the encoding, e.g. "abc:gzip"
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if tag.split(':', 1)[0] == etag:
+            response = make_response('', 304)
+            return cacheable_page(response, etag)
+    return None
+
+def cacheable_page(response, etag):
+    """Tag a rendered page for revalidation and compressed-body caching"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    g.page_cache_key = f'page:{etag}'
+    return response
@@ -1,7 +1,26 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import (render_template, redirect, url_for, flash, request, make_response,
+                   jsonify, abort, send_from_directory)
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import contains_eager
 from app import app, db
-from models import User, ChatRoom, Message
+from models import User, ChatRoom, Message, RoomSummary, user_chatroom
+from page_cache import (USERS_VERSION, user_rooms_version, bump_versions, DeferredRows,
+                        page_versions, page_etag, not_modified, cacheable_page)
+
+def user_chatrooms_query(user_id):
+    """The user's rooms with their summaries, most recently active first"""
+    return ChatRoom.query.join(
+        user_chatroom, user_chatroom.c.chatroom_id == ChatRoom.id
+    ).outerjoin(
+        ChatRoom.summary
+    ).options(
+        contains_eager(ChatRoom.summary)
+    ).filter(
+        user_chatroom.c.user_id == user_id
+    ).order_by(
+        RoomSummary.last_message_at.desc().nulls_last(),
+        ChatRoom.created_at.desc()
+    )
 
 @app.route('/')
 def index():
@@ -32,6 +51,7 @@ def register():
         user.set_password(request.form['password'])
         db.session.add(user)
         db.session.commit()
+        bump_versions(USERS_VERSION)
         login_user(user)
         return redirect(url_for('index'))
     return render_template('register.html')
@@ -41,21 +61,34 @@ def logout():
     logout_user()
     return redirect(url_for('login'))
 
+@app.route('/sw.js')
+def service_worker():
+    # Served from the root so the worker's scope covers the chat pages
+    response = make_response(send_from_directory('static/js', 'sw.js'))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/chat')
 @login_required
 def chat():
-    chatrooms = ChatRoom.query.join(
-        ChatRoom.users
-    ).filter(User.id == current_user.id).all()
+    versions = page_versions(current_user.id)
+    etag = page_etag(current_user.id, None, versions)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Deferred so cached sidebar fragments skip these queries
+    chatrooms = DeferredRows(user_chatrooms_query(current_user.id))
     
     # Get all users for creating new chats
-    users = User.query.filter(User.id != current_user.id).all()
+    users = DeferredRows(User.query.filter(User.id != current_user.id))
     
-    return render_template('chat.html', 
+    return cacheable_page(make_response(render_template('chat.html', 
                          chatrooms=chatrooms,
                          users=users,
                          active_chat=None,
-                         messages=[])
+                         messages=[],
+                         versions=versions)), etag)
 
 @app.route('/profile')
 @login_required
@@ -69,19 +102,54 @@ def view_chat(chatroom_id):
     if current_user not in chatroom.users:
         flash('Access denied')
         return redirect(url_for('chat'))
+
+    # The service worker asks for the shell (no message history) and fills
+    # messages from the client store plus a delta from chat_history.
+    shell = request.args.get('shell') == '1'
+    versions = page_versions(current_user.id, chatroom_id)
+    etag = page_etag(current_user.id, chatroom_id, versions, shell=shell)
+    cached = not_modified(etag)
+    if cached:
+        return cached
         
-    chatrooms = ChatRoom.query.join(
-        'users'
-    ).filter(User.id == current_user.id).all()
+    # Deferred so cached sidebar fragments skip these queries
+    chatrooms = DeferredRows(user_chatrooms_query(current_user.id))
     
-    users = User.query.filter(User.id != current_user.id).all()
-    messages = Message.query.filter_by(chatroom_id=chatroom_id).order_by(Message.timestamp).all()
+    users = DeferredRows(User.query.filter(User.id != current_user.id))
+    # Left as a query so it only runs when the message fragment is not cached
+    messages = [] if shell else Message.query.filter_by(chatroom_id=chatroom_id).order_by(Message.timestamp)
     
-    return render_template('chat.html',
+    return cacheable_page(make_response(render_template('chat.html',
                          chatrooms=chatrooms,
                          users=users,
                          active_chat=chatroom,
-                         messages=messages)
+                         messages=messages,
+                         shell=shell,
+                         versions=versions)), etag)
+
+@app.route('/api/chat/<int:chatroom_id>/messages')
+@login_required
+def chat_history(chatroom_id):
+    """Messages newer than ``after``, older than ``before``, or the latest page"""
+    is_member = db.session.query(user_chatroom).filter_by(
+        user_id=current_user.id, chatroom_id=chatroom_id
+    ).first() is not None
+    if not is_member:
+        abort(404)
+
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    limit = max(1, min(request.args.get('limit', 200, type=int), 500))
+    rows, has_more = Message.history_page(
+        db.session.execute(Message.history_statement(chatroom_id, after, limit, before)).all(),
+        after, limit
+    )
+
+    return jsonify({
+        'chat_id': chatroom_id,
+        'messages': [message.to_dict(username) for message, username in rows],
+        'has_more': has_more
+    })
 
 @app.route('/chatroom/create', methods=['POST'])
 @login_required
@@ -94,6 +162,7 @@ def create_chatroom():
         chatroom.users.append(current_user)
         db.session.add(chatroom)
         db.session.commit()
+        bump_versions(user_rooms_version(current_user.id))
         return redirect(url_for('chat'))
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,277 @@
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+logger = logging.getLogger(__name__)
+
+class ServerSession(SecureCookieSession):
+    """Session whose data lives in a ``SessionBackend``; the cookie holds only the id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+        # dict.get skips the accessed tracking of SecureCookieSession.get
+        self.loaded_user_id = dict.get(self, '_user_id')
+
+    @property
+    def auth_changed(self):
+        return dict.get(self, '_user_id') != self.loaded_user_id
+
+class RedisSessionBackend:
+    """Sessions as Redis strings that expire natively via their TTL"""
+
+    def __init__(self, client, prefix='session:eunica:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, sid):
+        return self.client.get(self.prefix + sid)
+
+    def set(self, sid, payload, ttl):
+        self.client.set(self.prefix + sid, payload, ex=ttl)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+    def touch_many(self, sids, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        for sid in sids:
+            pipe.expire(self.prefix + sid, ttl)
+        pipe.execute()
+
+    def purge_expired(self):
+        return 0
+
+class MemorySessionBackend:
+    """In-process fallback when Redis is unavailable; not shared between workers"""
+
+    def __init__(self):
+        self._data = {}  # sid -> (payload, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        entry = self._data.get(sid)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            with self._lock:
+                self._data.pop(sid, None)
+            return None
+        return entry[0]
+
+    def set(self, sid, payload, ttl):
+        with self._lock:
+            self._data[sid] = (payload, time.time() + ttl)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def touch_many(self, sids, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            for sid in sids:
+                entry = self._data.get(sid)
+                if entry is not None:
+                    self._data[sid] = (entry[0], expires_at)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, entry in self._data.items() if entry[1] <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+class ServerSessionInterface(SessionInterface):
+    """Server-side sessions with a local near-cache and batched expiry refreshes.
+
+    The cookie carries a signed random session id. Session data is read
+    from the backend at most once per ``near_cache_ttl`` per process, so
+    a revoked or changed session is seen by other workers within that
+    window. Requests that do not change the session only extend its
+    expiry once per ``touch_interval``; those extensions are queued and
+    written in one pipeline every ``flush_interval`` by a background
+    thread instead of on the request path.
+    """
+    serializer = TaggedJSONSerializer()
+    salt = 'eunica-session'
+
+    def __init__(self, backend, near_cache_ttl=2, near_cache_size=10000,
+                 touch_interval=60, flush_interval=5):
+        self.backend = backend
+        self.near_cache_ttl = near_cache_ttl
+        self.near_cache_size = near_cache_size
+        self.touch_interval = touch_interval
+        self.flush_interval = flush_interval
+        self._local = OrderedDict()  # sid -> [payload, fetched_at, extended_at]
+        self._local_lock = threading.Lock()
+        self._pending = {}  # sid -> ttl
+        self._pending_lock = threading.Lock()
+        self._flusher = None
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    # Near-cache
+
+    def _remember(self, sid, payload, extended_at):
+        now = time.monotonic()
+        with self._local_lock:
+            self._local[sid] = [payload, now, extended_at]
+            self._local.move_to_end(sid)
+            while len(self._local) > self.near_cache_size:
+                self._local.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._local_lock:
+            self._local.pop(sid, None)
+
+    def _load(self, sid):
+        now = time.monotonic()
+        entry = self._local.get(sid)
+        if entry is not None and now - entry[1] < self.near_cache_ttl:
+            return entry[0]
+        try:
+            payload = self.backend.get(sid)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Error loading session: {str(e)}")
+            return None
+        if payload is None:
+            self._forget(sid)
+            return None
+        # Keep the last known extension time across near-cache refreshes
+        self._remember(sid, payload, entry[2] if entry is not None else 0)
+        return payload
+
+    # Batched expiry refreshes
+
+    def _touch(self, sid, ttl):
+        now = time.monotonic()
+        entry = self._local.get(sid)
+        if entry is not None and now - entry[2] < self.touch_interval:
+            return False
+        if entry is not None:
+            entry[2] = now
+        with self._pending_lock:
+            self._pending[sid] = ttl
+        if self._flusher is None:
+            self._start_flusher()
+        return True
+
+    def _start_flusher(self):
+        with self._pending_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop,
+                                                 name='session-touch', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write queued expiry extensions in one batch"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        by_ttl = {}
+        for sid, ttl in pending.items():
+            by_ttl.setdefault(ttl, []).append(sid)
+        for ttl, sids in by_ttl.items():
+            try:
+                self.backend.touch_many(sids, ttl)
+            except redis.exceptions.RedisError as e:
+                logger.error(f"Error extending sessions: {str(e)}")
+        return len(pending)
+
+    # SessionInterface
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('utf-8')
+            except BadSignature:
+                sid = None
+            if sid:
+                payload = self._load(sid)
+                if payload is not None:
+                    return ServerSession(self.serializer.loads(payload), sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def _delete(self, sid):
+        try:
+            self.backend.delete(sid)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Error deleting session: {str(e)}")
+        self._forget(sid)
+
+    def regenerate(self, session):
+        """Move ``session`` to a fresh id and drop the old one.
+
+        Called automatically when the logged-in user changes, so a session
+        id planted before login (session fixation) never becomes
+        authenticated.
+        """
+        self._delete(session.sid)
+        session.sid = secrets.token_urlsafe(32)
+        session.new = True
+        session.loaded_user_id = dict.get(session, '_user_id')
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session.new and session.auth_changed:
+            self.regenerate(session)
+
+        if not session:
+            if session.modified:
+                if not session.new:
+                    self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        if session.modified or session.new:
+            payload = self.serializer.dumps(dict(session))
+            try:
+                self.backend.set(session.sid, payload, ttl)
+            except redis.exceptions.RedisError as e:
+                logger.error(f"Error saving session: {str(e)}")
+                return
+            self._remember(session.sid, payload, time.monotonic())
+        elif not self._touch(session.sid, ttl) or not self.should_set_cookie(app, session):
+            return
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode('utf-8'),
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+        response.vary.add('Cookie')
@@ -0,0 +1,308 @@
+import bisect
+import hashlib
+import os
+import pickle
+import socket
+import threading
+import time
+
+import redis
+import socketio
+
+class HashRing:
+    """Consistent hash ring mapping keys to nodes.
+
+    Each node is placed at ``replicas`` points on the ring so that adding or
+    removing a node only moves about 1/N of the keys.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self._points = []
+        self._owners = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(str(value).encode('utf-8')).hexdigest()[:16], 16)
+
+    @property
+    def nodes(self):
+        return set(self._owners.values())
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = self._hash(f'{node}#{i}')
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+            self._owners[point] = node
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            point = self._hash(f'{node}#{i}')
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.remove(point)
+
+    def node_for(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+class RoomChannelRedisManager(socketio.PubSubManager):
+    """Redis client manager that filters room traffic by subscription.
+
+    The stock Redis manager publishes every emit on one channel, so every
+    node receives and unpickles the whole cluster's traffic. Here emits to a
+    room go to a per-room channel, and a node subscribes to a room channel
+    only while at least one of its own clients is in that room. Broadcasts,
+    multi-room emits, sid-targeted operations and callbacks still use the
+    shared channel.
+
+    The saving grows with how concentrated each room's members are on few
+    nodes; ``RoomShardedRedisManager`` adds the placement.
+
+    Every node must run this manager: a node on the stock RedisManager only
+    listens on the shared channel and never sees room emits. Switch a
+    cluster over with a full restart rather than a rolling deploy.
+
+    Subscription changes are applied by the listener thread between polls,
+    so a node starts receiving a newly joined room within ``poll_interval``.
+    """
+    name = 'redis-room-channels'
+
+    def __init__(self, url='redis://localhost:6379/0', channel='flask-socketio',
+                 poll_interval=0.05, write_only=False, logger=None,
+                 redis_options=None):
+        self.redis_url = url
+        self.redis_options = redis_options or {}
+        self.poll_interval = poll_interval
+        self._subscription_lock = threading.Lock()
+        self._wanted = set()
+        self._to_subscribe = set()
+        self._to_unsubscribe = set()
+        self._subscribed = set()
+        self._redis_connect()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def room_channel(self, namespace, room):
+        return f'{self.channel}:room:{namespace}:{room}'
+
+    def _redis_connect(self):
+        self.redis = redis.Redis.from_url(self.redis_url, **self.redis_options)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        # A new connection starts with no subscriptions; queue everything
+        with self._subscription_lock:
+            self._subscribed = set()
+            self._to_subscribe = set(self._wanted)
+            self._to_unsubscribe = set()
+
+    # Local room membership drives subscriptions
+
+    def _has_room_channel(self, sid, room):
+        # None is the namespace-wide room and a sid's private room only lives
+        # on the node holding that client.
+        return room is not None and room != sid and not isinstance(room, (list, tuple))
+
+    def basic_enter_room(self, sid, namespace, room, eio_sid=None):
+        super().basic_enter_room(sid, namespace, room, eio_sid=eio_sid)
+        if self._has_room_channel(sid, room):
+            channel = self.room_channel(namespace, room)
+            with self._subscription_lock:
+                if channel not in self._wanted:
+                    self._wanted.add(channel)
+                    self._to_subscribe.add(channel)
+                    self._to_unsubscribe.discard(channel)
+
+    def basic_leave_room(self, sid, namespace, room):
+        super().basic_leave_room(sid, namespace, room)
+        if self._has_room_channel(sid, room) and room not in self.rooms.get(namespace, {}):
+            channel = self.room_channel(namespace, room)
+            with self._subscription_lock:
+                if channel in self._wanted:
+                    self._wanted.discard(channel)
+                    self._to_unsubscribe.add(channel)
+                    self._to_subscribe.discard(channel)
+
+    # Publishing
+
+    def _channel_for(self, data):
+        room = data.get('room')
+        namespace = data.get('namespace') or '/'
+        if data['method'] not in ('emit', 'close_room') or room is None:
+            return self.channel
+        if isinstance(room, (list, tuple)) or data.get('callback'):
+            return self.channel
+        if self.is_connected(room, namespace):
+            # Addressed to one of our own clients by sid; already delivered
+            return None
+        if room in self.rooms.get(namespace, {}) or not self._looks_like_sid(room):
+            return self.room_channel(namespace, room)
+        return self.channel
+
+    @staticmethod
+    def _looks_like_sid(room):
+        # Socket.IO sids are 20-character URL-safe tokens; chat and user rooms
+        # are numeric ids or "user_<id>".
+        return isinstance(room, str) and len(room) == 20 and not room.startswith('user_')
+
+    def _publish(self, data):
+        channel = self._channel_for(data)
+        if channel is None:
+            return
+        payload = pickle.dumps(data)
+        for attempt in range(2):
+            try:
+                if attempt:
+                    self.redis = redis.Redis.from_url(self.redis_url, **self.redis_options)
+                return self.redis.publish(channel, payload)
+            except redis.exceptions.RedisError:
+                self._get_logger().error(
+                    'Cannot publish to redis... ' + ('giving up' if attempt else 'retrying'))
+
+    # Listening
+
+    def _apply_subscriptions(self):
+        # Runs before every poll, so only pending changes are touched; the
+        # unlocked emptiness check keeps the common case O(1).
+        if self._subscribed and not (self._to_subscribe or self._to_unsubscribe):
+            return
+        with self._subscription_lock:
+            added, self._to_subscribe = self._to_subscribe, set()
+            removed, self._to_unsubscribe = self._to_unsubscribe, set()
+        if not self._subscribed:
+            added.update(self._base_channels())
+        added -= self._subscribed
+        removed &= self._subscribed
+        if added:
+            self.pubsub.subscribe(*added)
+            self._subscribed |= added
+        if removed:
+            self.pubsub.unsubscribe(*removed)
+            self._subscribed -= removed
+
+    def _base_channels(self):
+        return {self.channel}
+
+    def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                self._apply_subscriptions()
+                message = self.pubsub.get_message(timeout=self.poll_interval)
+                retry_sleep = 1
+            except redis.exceptions.RedisError:
+                self._get_logger().error(
+                    f'Cannot receive from redis... retrying in {retry_sleep} secs')
+                time.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+                self._redis_connect()
+                continue
+            if not message or message.get('type') != 'message':
+                continue
+            if self._handle_control(message):
+                continue
+            yield message['data']
+
+    def _handle_control(self, message):
+        """Consume messages meant for the manager itself; True if handled"""
+        return False
+
+class RoomShardedRedisManager(RoomChannelRedisManager):
+    """Room channels plus room-to-node placement by consistent hashing.
+
+    Nodes announce themselves on a membership channel and the live nodes
+    form a ``HashRing`` that names an owner node for every room. Clients
+    learn the owner of their room from ``room_joined`` and reconnect with
+    ``?node=<owner>`` in the Socket.IO URL; the load balancer routes on that
+    parameter (servers named by ``node_id``), so each room's members end up
+    on one node and only that node subscribes to the room channel.
+
+    When nodes join or leave, local members of rooms whose owner changed
+    get a ``room_rebalanced`` event naming the new owner and reconnect
+    there. Without a load balancer that routes on ``node`` clients simply
+    stay where they are: delivery is unaffected, only the saving is lost.
+    """
+    name = 'redis-sharded'
+
+    def __init__(self, url='redis://localhost:6379/0', channel='flask-socketio',
+                 node_id=None, heartbeat_interval=5, **kwargs):
+        self.node_id = node_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.heartbeat_interval = heartbeat_interval
+        self.peers = {}  # node_id -> last_seen
+        self.ring = HashRing([self.node_id])
+        self._last_heartbeat = 0
+        self._leaving = False
+        super().__init__(url, channel=channel, **kwargs)
+
+    @property
+    def nodes_channel(self):
+        return f'{self.channel}:nodes'
+
+    def node_for(self, room):
+        return self.ring.node_for(room)
+
+    def _base_channels(self):
+        return {self.channel, self.nodes_channel}
+
+    # Cluster membership
+
+    def _heartbeat(self, state='up'):
+        self._last_heartbeat = time.monotonic()
+        self.redis.publish(self.nodes_channel, pickle.dumps({
+            'node_id': self.node_id, 'state': state
+        }))
+
+    def _apply_subscriptions(self):
+        super()._apply_subscriptions()
+        # Runs on every poll of the listener thread, which makes it the
+        # heartbeat clock as well
+        if not self._leaving and time.monotonic() - self._last_heartbeat >= self.heartbeat_interval:
+            self._heartbeat()
+            self._update_ring()
+
+    def _handle_control(self, message):
+        if message['channel'] != self.nodes_channel.encode('utf-8'):
+            return False
+        try:
+            data = pickle.loads(message['data'])
+        except Exception:
+            self._get_logger().exception('Bad membership message')
+            return True
+        if data.get('node_id') and data['node_id'] != self.node_id:
+            if data.get('state') == 'down':
+                self.peers.pop(data['node_id'], None)
+            else:
+                self.peers[data['node_id']] = time.monotonic()
+        self._update_ring()
+        return True
+
+    def _update_ring(self):
+        expiry = time.monotonic() - 3 * self.heartbeat_interval
+        self.peers = {node: seen for node, seen in self.peers.items() if seen >= expiry}
+        live = set(self.peers) | {self.node_id}
+        if live != self.ring.nodes:
+            self._rebalance(live)
+
+    def _rebalance(self, live):
+        previous = self.ring
+        self.ring = HashRing(live, replicas=previous.replicas)
+        self._get_logger().info(f'Cluster membership changed: {sorted(live)}')
+        for namespace, rooms in list(self.rooms.items()):
+            for room, members in list(rooms.items()):
+                if room is None or room in members:
+                    continue
+                owner = self.ring.node_for(room)
+                if owner != previous.node_for(room):
+                    self.emit('room_rebalanced', {'room': room, 'node': owner},
+                              namespace=namespace, room=room, ignore_queue=True)
+
+    def shutdown(self):
+        """Tell peers this node is leaving so they rebalance immediately"""
+        self._leaving = True
+        try:
+            self._heartbeat(state='down')
+        except redis.exceptions.RedisError:
+            pass
@@ -0,0 +1,65 @@
+// IndexedDB-backed message store used for offline-first chat history. Each
+// user gets their own database so accounts on a shared device never mix.
+function openChatStore(userId) {
+    const DB_NAME = `eunica-messages-${userId}`;
+    const DB_VERSION = 1;
+    const STORE = 'messages';
+    let dbPromise = null;
+
+    function open() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, DB_VERSION);
+                request.onupgradeneeded = () => {
+                    const store = request.result.createObjectStore(STORE, { keyPath: 'id' });
+                    store.createIndex('chat_id', ['chat_id', 'id']);
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    function chatRange(chatId) {
+        return IDBKeyRange.bound([chatId, 0], [chatId, Infinity]);
+    }
+
+    async function getMessages(chatId) {
+        const db = await open();
+        return new Promise((resolve, reject) => {
+            const request = db.transaction(STORE).objectStore(STORE)
+                .index('chat_id').getAll(chatRange(chatId));
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function lastId(chatId) {
+        const db = await open();
+        return new Promise((resolve, reject) => {
+            const request = db.transaction(STORE).objectStore(STORE)
+                .index('chat_id').openCursor(chatRange(chatId), 'prev');
+            request.onsuccess = () => resolve(request.result ? request.result.value.id : 0);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function putMessages(messages) {
+        if (!messages.length) return;
+        const db = await open();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE, 'readwrite');
+            const store = tx.objectStore(STORE);
+            messages.forEach(message => {
+                if (message.id && message.chat_id) store.put(message);
+            });
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    return { getMessages, lastId, putMessages };
+}
+
+window.ChatStore = { forUser: openChatStore };
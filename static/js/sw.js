@@ -1,22 +1,21 @@
-const CACHE_NAME = 'eunica-cache-v1';
+const CACHE_NAME = 'eunica-cache-v2';
+const SHELL_CACHE = 'eunica-shell-v2';
 const STATIC_CACHE = [
-    '/',
     '/static/css/main.css',
-    '/static/js/app.js',
-    '/static/generated-icon.png',
+    '/static/js/chat-store.js',
     'https://cdn.replit.com/agent/bootstrap-agent-dark-theme.min.css',
     'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css',
     'https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.js',
     'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js'
 ];
+const CHAT_PAGE = /^\/chat\/(\d+)$/;
 
 // Install event
 self.addEventListener('install', event => {
     event.waitUntil(
         caches.open(CACHE_NAME)
-            .then(cache => {
-                return cache.addAll(STATIC_CACHE);
-            })
+            .then(cache => cache.addAll(STATIC_CACHE))
+            .then(() => self.skipWaiting())
     );
 });
 
@@ -26,61 +25,124 @@ self.addEventListener('activate', event => {
         caches.keys().then(cacheNames => {
             return Promise.all(
                 cacheNames.map(cache => {
-                    if (cache !== CACHE_NAME) {
+                    if (cache !== CACHE_NAME && cache !== SHELL_CACHE) {
                         return caches.delete(cache);
                     }
                 })
             );
-        })
+        }).then(() => self.clients.claim())
     );
 });
 
-// Fetch event
-self.addEventListener('fetch', event => {
-    // Skip cross-origin requests
-    if (!event.request.url.startsWith(self.location.origin)) {
-        return;
-    }
-    
+function offlineResponse() {
+    return new Response('<h1>You are offline</h1>', {
+        status: 503,
+        headers: { 'Content-Type': 'text/html; charset=utf-8' }
+    });
+}
+
+// Static assets: cache first, then network
+function cacheFirst(request) {
+    return caches.match(request).then(cached => {
+        if (cached) {
+            return cached;
+        }
+        return fetch(request).then(response => {
+            if (response && response.status === 200 && response.type === 'basic') {
+                const responseToCache = response.clone();
+                caches.open(CACHE_NAME).then(cache => cache.put(request, responseToCache));
+            }
+            return response;
+        });
+    });
+}
+
+// Chat pages: revalidate the cached shell (page without message history)
+// before using it. The ETag is per user, so a 304 confirms the shell belongs
+// to whoever is signed in now and costs a round trip but no page body.
+// Anything else means a different session: drop the local data and let the
+// server answer the navigation. The shell is used unvalidated only offline.
+function chatShell(event, chatId) {
+    const shellUrl = `/chat/${chatId}?shell=1`;
     event.respondWith(
-        caches.match(event.request)
-            .then(response => {
-                if (response) {
-                    return response;
+        caches.open(SHELL_CACHE).then(cache =>
+            cache.match(shellUrl).then(cached => {
+                const headers = {};
+                const etag = cached && cached.headers.get('ETag');
+                if (etag) {
+                    headers['If-None-Match'] = etag;
                 }
-                
-                // Clone the request
-                const fetchRequest = event.request.clone();
-                
-                return fetch(fetchRequest).then(response => {
-                    // Check if valid response
-                    if (!response || response.status !== 200 || response.type !== 'basic') {
-                        return response;
-                    }
-                    
-                    // Clone the response
-                    const responseToCache = response.clone();
-                    
-                    // Add to cache
-                    caches.open(CACHE_NAME)
-                        .then(cache => {
-                            cache.put(event.request, responseToCache);
-                        });
-                    
-                    return response;
-                });
+                return fetch(shellUrl, { credentials: 'same-origin', headers, redirect: 'manual' })
+                    .then(response => {
+                        if (response.status === 200) {
+                            cache.put(shellUrl, response.clone());
+                            return response;
+                        }
+                        if (response.status === 304 && cached) {
+                            return cached;
+                        }
+                        return clearUserData().then(() => fetch(event.request));
+                    }, () => cached || offlineResponse());
             })
+        ).catch(offlineResponse)
     );
-});
+}
+
+// Message stores are per user (see chat-store.js); browsers without
+// indexedDB.databases() can only drop the stores they know by name.
+function deleteDatabase(name) {
+    return new Promise(resolve => {
+        const request = indexedDB.deleteDatabase(name);
+        request.onsuccess = request.onerror = request.onblocked = () => resolve();
+    });
+}
 
-// Handle offline functionality
+function clearUserData() {
+    const databases = indexedDB.databases
+        ? indexedDB.databases().then(list => list.map(db => db.name).filter(name => name.startsWith('eunica')))
+        : Promise.resolve(['eunica']);
+    return Promise.all([
+        caches.delete(SHELL_CACHE),
+        databases.then(names => Promise.all(names.map(deleteDatabase)))
+    ]);
+}
+
+// Fetch event
 self.addEventListener('fetch', event => {
-    if (event.request.mode === 'navigate') {
-        event.respondWith(
-            fetch(event.request)
-                .catch(() => {
-                    return caches.match('/offline.html');
-                })
-        );
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (request.method !== 'GET') {
+        return;
     }
+
+    if (url.origin !== self.location.origin) {
+        if (STATIC_CACHE.includes(request.url)) {
+            event.respondWith(caches.match(request).then(cached => cached || fetch(request)));
+        }
+        return;
+    }
+
+    if (url.pathname.startsWith('/static/')) {
+        event.respondWith(cacheFirst(request));
+        return;
+    }
+
+    if (request.mode !== 'navigate') {
+        // API calls, socket.io polling and everything else go to the network
+        return;
+    }
+
+    if (url.pathname === '/logout' || url.pathname === '/login') {
+        event.respondWith(clearUserData().then(() => fetch(request)));
+        return;
+    }
+
+    const chatPage = url.pathname.match(CHAT_PAGE);
+    if (chatPage && !url.search) {
+        chatShell(event, chatPage[1]);
+        return;
+    }
+
+    event.respondWith(fetch(request).catch(offlineResponse));
 });
@@ -0,0 +1,59 @@
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# The app module configures itself from the environment on import, so point
+# it at a throwaway SQLite database before any test imports it.
+_db_dir = tempfile.mkdtemp(prefix='eunica-tests-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+os.environ.setdefault('FLASK_SECRET_KEY', 'test')
+os.environ.pop('REDIS_URL', None)
+
+_names = itertools.count()
+
+@pytest.fixture
+def make_user():
+    """Create a user with a unique name and the password 'secret'"""
+    from app import app, db
+    from models import User
+
+    def make(prefix='user'):
+        with app.app_context():
+            user = User(username=f'{prefix}_{next(_names)}')
+            user.set_password('secret')
+            db.session.add(user)
+            db.session.commit()
+            return user.id, user.username
+    return make
+
+@pytest.fixture
+def make_room():
+    """Create a group room with the given member ids"""
+    from app import app, db
+    from models import ChatRoom, User
+
+    def make(*user_ids):
+        with app.app_context():
+            room = ChatRoom(name=f'room_{next(_names)}', is_group=True)
+            room.users.extend(db.session.get(User, user_id) for user_id in user_ids)
+            db.session.add(room)
+            db.session.commit()
+            return room.id
+    return make
+
+@pytest.fixture
+def login():
+    """Return a test client logged in as ``username``"""
+    from app import app
+
+    def client_for(username):
+        client = app.test_client()
+        # The Socket.IO test client builds a bare environ; match it so strong
+        # session protection accepts the session on both clients
+        client.environ_base.clear()
+        response = client.post('/login', data={'username': username, 'password': 'secret'})
+        assert response.status_code == 302
+        return client
+    return client_for
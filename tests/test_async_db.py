@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from app import app, db
+from async_db import AsyncDatabase, app_database_url, async_database_url
+from models import RoomSummary
+
+@pytest.fixture
+def async_db():
+    async_db = AsyncDatabase(app_database_url())
+    yield async_db
+    asyncio.run(async_db.engine.dispose())
+
+def test_driver_mapping():
+    assert async_database_url('sqlite:///chat.db').drivername == 'sqlite+aiosqlite'
+    url = async_database_url('postgresql://u:p@db/chat?sslmode=require')
+    assert url.drivername == 'postgresql+asyncpg'
+    assert url.query == {'ssl': 'require'}
+    assert url.password == 'p'
+
+def test_uses_the_resolved_app_database(async_db):
+    with app.app_context():
+        assert async_db.engine.url.database == db.engine.url.database
+
+def test_send_message_and_history_round_trip(async_db, make_user, make_room):
+    sender_id, sender = make_user()
+    other_id, _ = make_user()
+    room_id = make_room(sender_id, other_id)
+
+    async def scenario():
+        assert await async_db.is_member(sender_id, room_id)
+        sent = [await async_db.send_message(sender_id, sender, room_id, f'hello {i}')
+                for i in range(3)]
+        first_page = await async_db.history(room_id, limit=2)
+        newer = await async_db.history(room_id, after=sent[0][0].id)
+        return sent, first_page, newer
+
+    sent, (rows, has_more), (newer, newer_more) = asyncio.run(scenario())
+    message, room_name, member_ids = sent[-1]
+    assert sorted(member_ids) == sorted([sender_id, other_id])
+    assert [m.content for m, _ in rows] == ['hello 1', 'hello 2']
+    assert has_more
+    assert [m.content for m, _ in newer] == ['hello 1', 'hello 2']
+    assert not newer_more
+    assert {username for _, username in rows} == {sender}
+    with app.app_context():
+        summary = db.session.get(RoomSummary, room_id)
+        assert summary.message_count == 3
+        assert summary.last_message_id == message.id
+
+def test_non_members_cannot_send(async_db, make_user, make_room):
+    member_id, _ = make_user()
+    outsider_id, outsider = make_user()
+    room_id = make_room(member_id)
+
+    async def scenario():
+        assert not await async_db.is_member(outsider_id, room_id)
+        await async_db.send_message(outsider_id, outsider, room_id, 'hi')
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from app import app, db
+from health import HealthProber
+
+@pytest.fixture
+def prober():
+    return HealthProber(app, interval=5, timeout=1)
+
+def test_readiness_before_first_probe(prober):
+    assert prober.readiness() == (False, {'status': 'starting'})
+
+def test_ready_after_probe(prober):
+    prober.probe()
+    ready, payload = prober.readiness()
+    assert ready
+    assert payload['status'] == 'ready'
+    assert payload['components']['database']['status'] == 'ok'
+    assert payload['warnings'] == []
+
+def test_stale_snapshot_is_not_ready(prober):
+    prober.probe()
+    prober.snapshot['checked_at'] -= prober.stale_after + 1
+    ready, payload = prober.readiness()
+    assert not ready
+    assert payload['reasons'] == ['probe stale']
+
+def test_component_down_is_not_ready(prober, monkeypatch):
+    def broken():
+        raise RuntimeError('connection refused')
+    monkeypatch.setattr(prober, '_check_database', broken)
+    prober.probe()
+    ready, payload = prober.readiness()
+    assert not ready
+    assert payload['reasons'] == ['database down']
+    assert payload['components']['database']['error'] == 'connection refused'
+
+def test_pool_saturation_is_a_warning_by_default(prober):
+    prober.probe()
+    prober.snapshot['pool']['saturation'] = 1.0
+    ready, payload = prober.readiness()
+    assert ready
+    assert payload['warnings'] == ['database pool saturated']
+
+def test_pool_saturation_can_fail_readiness():
+    prober = HealthProber(app, timeout=1, fail_on_pool_saturation=True)
+    prober.probe()
+    prober.snapshot['pool']['saturation'] = 1.0
+    ready, payload = prober.readiness()
+    assert not ready
+    assert payload['reasons'] == ['database pool saturated']
+
+def test_probe_does_not_wait_on_a_saturated_app_pool(prober):
+    with app.app_context():
+        pool = db.engine.pool
+        capacity = pool.size() + pool._max_overflow
+        connections = [db.engine.connect() for _ in range(capacity)]
+    try:
+        started = time.monotonic()
+        prober.probe()
+        elapsed = time.monotonic() - started
+    finally:
+        for connection in connections:
+            connection.close()
+    assert elapsed < prober.timeout
+    ready, payload = prober.readiness()
+    assert ready
+    assert payload['pool']['saturation'] == 1.0
+    assert payload['warnings'] == ['database pool saturated']
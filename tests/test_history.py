@@ -0,0 +1,47 @@
+import pytest
+
+from app import app, db
+from models import Message
+
+@pytest.fixture
+def room(make_user, make_room):
+    user_id, username = make_user()
+    room_id = make_room(user_id)
+    with app.app_context():
+        db.session.add_all(Message(content=f'message {i}', sender_id=user_id, chatroom_id=room_id)
+                           for i in range(25))
+        db.session.commit()
+        ids = [m.id for m in Message.query.filter_by(chatroom_id=room_id).order_by(Message.id)]
+    return room_id, username, ids
+
+def history(client, room_id, **params):
+    response = client.get(f'/api/chat/{room_id}/messages', query_string=params)
+    assert response.status_code == 200
+    data = response.get_json()
+    return [m['id'] for m in data['messages']], data['has_more']
+
+def test_latest_page(room, login):
+    room_id, username, ids = room
+    assert history(login(username), room_id, limit=10) == (ids[-10:], True)
+
+def test_forward_from_after(room, login):
+    room_id, username, ids = room
+    assert history(login(username), room_id, after=ids[19], limit=10) == (ids[20:], False)
+
+def test_backward_pages_reach_the_first_message(room, login):
+    room_id, username, ids = room
+    client = login(username)
+    loaded, has_more = history(client, room_id, limit=10)
+    while has_more:
+        page, has_more = history(client, room_id, before=loaded[0], limit=10)
+        loaded = page + loaded
+    assert loaded == ids
+
+def test_limit_is_clamped(room, login):
+    room_id, username, ids = room
+    assert history(login(username), room_id, limit=0) == (ids[-1:], True)
+
+def test_non_members_get_404(room, login, make_user):
+    room_id, _, _ = room
+    _, outsider = make_user()
+    assert login(outsider).get(f'/api/chat/{room_id}/messages').status_code == 404
@@ -0,0 +1,100 @@
+import pytest
+from sqlalchemy import event
+
+from app import app, db, socketio
+# After app: page_cache is imported by app's own route modules
+import page_cache
+from models import ChatRoom, Message
+
+@pytest.fixture
+def chat(make_user, make_room, login):
+    (reader_id, reader), (sender_id, sender) = make_user(), make_user()
+    room_id = make_room(reader_id, sender_id)
+    return room_id, login(reader), login(sender)
+
+def send(flask_client, room_id, text):
+    client = socketio.test_client(app, flask_test_client=flask_client)
+    client.emit('join', {'room': str(room_id)})
+    ok = client.emit('send_message', {'chat_id': room_id, 'message': text}, callback=True)
+    received = [packet['name'] for packet in client.get_received()]
+    client.disconnect()
+    return ok, received
+
+@pytest.fixture
+def failing_cache(monkeypatch):
+    def fail(*args, **kwargs):
+        raise ConnectionError('cache down')
+    monkeypatch.setattr(page_cache.cache.cache, 'inc', fail)
+
+def test_unchanged_page_revalidates_with_304(chat):
+    room_id, reader, _ = chat
+    first = reader.get(f'/chat/{room_id}')
+    assert first.status_code == 200
+    again = reader.get(f'/chat/{room_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+def test_message_from_another_member_invalidates_the_etag(chat):
+    room_id, reader, sender = chat
+    first = reader.get(f'/chat/{room_id}')
+    ok, _ = send(sender, room_id, 'fresh news')
+    assert ok
+    again = reader.get(f'/chat/{room_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 200
+    assert again.headers['ETag'] != first.headers['ETag']
+    assert b'fresh news' in again.data
+
+def test_shell_etag_changes_when_the_sidebar_does(chat):
+    room_id, reader, sender = chat
+    first = reader.get(f'/chat/{room_id}?shell=1')
+    send(sender, room_id, 'hello')
+    again = reader.get(f'/chat/{room_id}?shell=1', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 200
+
+def test_cached_fragments_skip_the_sidebar_queries(chat):
+    room_id, reader, _ = chat
+    reader.get(f'/chat/{room_id}')
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        # No If-None-Match: the page renders again from cached fragments
+        assert reader.get(f'/chat/{room_id}').status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert statements
+    assert not [s for s in statements if 'room_summary' in s]
+    assert not [s for s in statements if 'user.id !=' in s]
+
+def test_message_is_delivered_when_the_version_bump_fails(chat, failing_cache):
+    room_id, _, sender = chat
+    ok, received = send(sender, room_id, 'still sent')
+    assert ok
+    assert 'new_message' in received
+    with app.app_context():
+        assert Message.query.filter_by(chatroom_id=room_id, content='still sent').count() == 1
+
+def test_room_is_created_when_the_version_bump_fails(chat, failing_cache):
+    _, reader, _ = chat
+    response = reader.post('/chatroom/create', data={'name': 'after outage'})
+    assert response.status_code == 302
+    with reader.session_transaction() as session:
+        assert '_flashes' not in session
+    with app.app_context():
+        assert ChatRoom.query.filter_by(name='after outage').count() == 1
+
+def test_deferred_rows_run_once_on_use():
+    class Query:
+        calls = 0
+        def all(self):
+            Query.calls += 1
+            return []
+    rows = page_cache.DeferredRows(Query())
+    assert Query.calls == 0
+    assert not rows
+    assert list(rows) == []
+    assert Query.calls == 1
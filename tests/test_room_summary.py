@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, db, backfill_room_summaries
+from models import Message, RoomSummary, User
+
+@pytest.fixture
+def room(make_user, make_room):
+    user_id, username = make_user()
+    return make_room(user_id), user_id, username
+
+def add_message(room_id, user_id, content, timestamp=None):
+    """Insert a message without touching its summary; returns the flushed message"""
+    message = Message(content=content, sender_id=user_id, chatroom_id=room_id,
+                      timestamp=timestamp or datetime.utcnow())
+    db.session.add(message)
+    db.session.flush()
+    return message
+
+def summary(room_id):
+    db.session.expire_all()
+    return db.session.get(RoomSummary, room_id)
+
+def test_first_message_creates_the_summary(room):
+    room_id, user_id, _ = room
+    with app.app_context():
+        assert summary(room_id) is None
+        message = add_message(room_id, user_id, 'hello')
+        RoomSummary.record_message(message, db.session.get(User, user_id))
+        db.session.commit()
+        row = summary(room_id)
+        assert row.message_count == 1
+        assert row.last_message_id == message.id
+        assert row.last_message_snippet == 'hello'
+
+def test_newer_message_moves_the_summary_forward(room):
+    room_id, user_id, _ = room
+    with app.app_context():
+        sender = db.session.get(User, user_id)
+        for content in ('one', 'two'):
+            RoomSummary.record_message(add_message(room_id, user_id, content), sender)
+        db.session.commit()
+        row = summary(room_id)
+        assert (row.message_count, row.last_message_snippet) == (2, 'two')
+
+def test_out_of_order_message_only_bumps_the_count(room):
+    room_id, user_id, username = room
+    with app.app_context():
+        older = add_message(room_id, user_id, 'older', datetime.utcnow() - timedelta(minutes=1))
+        newer = add_message(room_id, user_id, 'newer')
+        dialect = db.engine.dialect.name
+        # The transaction of the newer message commits first
+        db.session.execute(RoomSummary.record_statement(dialect, newer, user_id, username))
+        db.session.execute(RoomSummary.record_statement(dialect, older, user_id, username))
+        db.session.commit()
+        row = summary(room_id)
+        assert row.message_count == 2
+        assert row.last_message_id == newer.id
+        assert row.last_message_snippet == 'newer'
+        assert row.last_message_at == newer.timestamp
+
+def test_racing_first_messages_share_one_summary(room):
+    room_id, user_id, username = room
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        # Both senders build their upsert while the room has no summary row;
+        # SQLite serializes writers, so run them back to back in one session
+        statements = [RoomSummary.record_statement(dialect, add_message(room_id, user_id, content),
+                                                   user_id, username)
+                      for content in ('first 0', 'first 1')]
+        assert summary(room_id) is None
+        for statement in statements:
+            db.session.execute(statement)
+        db.session.commit()
+        row = summary(room_id)
+        assert row.message_count == 2
+        assert row.last_message_snippet == 'first 1'
+
+def test_unsupported_dialect_is_rejected(room):
+    room_id, user_id, username = room
+    message = Message(id=1, content='x', chatroom_id=room_id, timestamp=datetime.utcnow())
+    with pytest.raises(ValueError):
+        RoomSummary.record_statement('mysql', message, user_id, username)
+
+def test_rebuild_recomputes_one_room(room, make_room):
+    room_id, user_id, _ = room
+    other_id = make_room(user_id)
+    with app.app_context():
+        sender = db.session.get(User, user_id)
+        for i in range(3):
+            add_message(room_id, user_id, f'unsummarized {i}')
+        RoomSummary.record_message(add_message(other_id, user_id, 'kept'), sender)
+        db.session.commit()
+
+        assert RoomSummary.rebuild(room_id) == 1
+        row = summary(room_id)
+        assert (row.message_count, row.last_message_snippet) == (3, 'unsummarized 2')
+        assert summary(other_id).message_count == 1
+
+def test_rebuild_drops_summaries_of_rooms_without_messages(room):
+    room_id, user_id, _ = room
+    with app.app_context():
+        message = add_message(room_id, user_id, 'gone')
+        RoomSummary.record_message(message, db.session.get(User, user_id))
+        db.session.commit()
+        db.session.delete(message)
+        db.session.commit()
+        assert RoomSummary.rebuild(room_id) == 0
+        assert summary(room_id) is None
+
+def test_backfill_builds_every_room_when_the_table_is_empty(room, make_room):
+    room_id, user_id, _ = room
+    other_id = make_room(user_id)
+    with app.app_context():
+        db.session.query(RoomSummary).delete()
+        add_message(room_id, user_id, 'a')
+        add_message(room_id, user_id, 'b')
+        add_message(other_id, user_id, 'c')
+        db.session.commit()
+        backfill_room_summaries()
+        assert summary(room_id).message_count == 2
+        assert summary(other_id).message_count == 1
+        rooms_with_messages = db.session.query(Message.chatroom_id).distinct().count()
+        assert db.session.query(RoomSummary).count() == rooms_with_messages
@@ -0,0 +1,142 @@
+import time
+
+import pytest
+from flask import Flask, session
+
+from sessions import MemorySessionBackend, ServerSessionInterface
+
+class CountingBackend(MemorySessionBackend):
+    """Memory backend that records how it is called"""
+
+    def __init__(self):
+        super().__init__()
+        self.gets = 0
+        self.touches = []
+
+    def get(self, sid):
+        self.gets += 1
+        return super().get(sid)
+
+    def touch_many(self, sids, ttl):
+        self.touches.append(sorted(sids))
+        super().touch_many(sids, ttl)
+
+@pytest.fixture
+def backend():
+    return CountingBackend()
+
+@pytest.fixture
+def interface(backend):
+    # A long flush interval keeps the background thread out of the way;
+    # tests call flush() themselves.
+    return ServerSessionInterface(backend, near_cache_ttl=60, touch_interval=60,
+                                  flush_interval=3600)
+
+@pytest.fixture
+def app(interface):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = interface
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('value', '')
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session['_user_id'] = str(user_id)
+        return 'ok'
+
+    @app.route('/clear')
+    def clear():
+        session.clear()
+        return 'ok'
+
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def session_id(client, interface, app):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return interface._signer(app).unsign(cookie.value).decode('utf-8') if cookie else None
+
+def test_session_round_trip(client):
+    client.get('/set/hello')
+    assert client.get('/get').text == 'hello'
+
+def test_reads_are_served_from_the_near_cache(client, backend):
+    client.get('/set/hello')
+    for _ in range(3):
+        assert client.get('/get').text == 'hello'
+    assert backend.gets == 0
+
+def test_near_cache_expires(client, backend, interface):
+    interface.near_cache_ttl = 0.05
+    client.get('/set/hello')
+    time.sleep(0.1)
+    assert client.get('/get').text == 'hello'
+    assert backend.gets == 1
+
+def test_deleted_session_is_seen_after_near_cache_expiry(client, backend, interface, app):
+    interface.near_cache_ttl = 0.05
+    client.get('/set/hello')
+    backend.delete(session_id(client, interface, app))
+    time.sleep(0.1)
+    assert client.get('/get').text == ''
+
+def test_touches_are_batched(app, backend, interface):
+    interface.touch_interval = 0
+    clients = [app.test_client() for _ in range(3)]
+    for client in clients:
+        client.get('/set/hello')
+    for client in clients:
+        client.get('/get')
+        client.get('/get')
+    assert backend.touches == []
+    assert interface.flush() == 3
+    assert backend.touches == [sorted(session_id(c, interface, app) for c in clients)]
+    assert interface.flush() == 0
+
+def test_touch_waits_for_touch_interval(client, interface):
+    client.get('/set/hello')
+    client.get('/get')
+    assert interface.flush() == 0
+
+def test_unmodified_request_does_not_rewrite_the_cookie(client):
+    client.get('/set/hello')
+    response = client.get('/get')
+    assert 'Set-Cookie' not in response.headers
+
+def test_clearing_the_session_deletes_it(client, backend, interface, app):
+    client.get('/set/hello')
+    sid = session_id(client, interface, app)
+    client.get('/clear')
+    assert backend.get(sid) is None
+    assert sid not in interface._local
+    assert client.get_cookie(app.config['SESSION_COOKIE_NAME']) is None
+
+def test_empty_new_session_is_not_stored(client, backend, app):
+    client.get('/get')
+    assert backend._data == {}
+    assert client.get_cookie(app.config['SESSION_COOKIE_NAME']) is None
+
+def test_login_rotates_the_session_id(client, backend, interface, app):
+    client.get('/set/hello')
+    before = session_id(client, interface, app)
+    client.get('/login/1')
+    after = session_id(client, interface, app)
+    assert after != before
+    assert backend.get(before) is None
+    assert client.get('/get').text == 'hello'
+
+def test_tampered_cookie_starts_a_new_session(client, app):
+    client.get('/set/hello')
+    client.set_cookie(app.config['SESSION_COOKIE_NAME'], 'forged.signature')
+    assert client.get('/get').text == ''
@@ -0,0 +1,171 @@
+import pickle
+
+import pytest
+
+from sharding import HashRing, RoomChannelRedisManager, RoomShardedRedisManager
+
+SID = 'a' * 20
+OTHER_SID = 'b' * 20
+
+class FakePubSub:
+    """Records subscription calls instead of talking to Redis"""
+
+    def __init__(self):
+        self.calls = []
+
+    def subscribe(self, *channels):
+        self.calls.append(('subscribe', set(channels)))
+
+    def unsubscribe(self, *channels):
+        self.calls.append(('unsubscribe', set(channels)))
+
+@pytest.fixture
+def manager():
+    # redis-py connects lazily, so no server is needed until a publish
+    manager = RoomChannelRedisManager('redis://localhost:6379/0')
+    manager.pubsub = FakePubSub()
+    return manager
+
+def connect(manager, sid, eio_sid):
+    manager.basic_enter_room(sid, '/', None, eio_sid=eio_sid)
+    manager.basic_enter_room(sid, '/', sid, eio_sid=eio_sid)
+
+def emit(room, **extra):
+    return dict(method='emit', event='new_message', data={}, namespace='/', room=room, **extra)
+
+def test_room_emit_uses_the_room_channel(manager):
+    assert manager._channel_for(emit('42')) == 'flask-socketio:room:/:42'
+    assert manager._channel_for(emit('user_7')) == 'flask-socketio:room:/:user_7'
+
+def test_broadcasts_and_multi_room_emits_use_the_shared_channel(manager):
+    assert manager._channel_for(emit(None)) == 'flask-socketio'
+    assert manager._channel_for(emit(['1', '2'])) == 'flask-socketio'
+    assert manager._channel_for(emit('42', callback=('/', SID, 1))) == 'flask-socketio'
+    assert manager._channel_for(dict(method='disconnect', sid=SID, namespace='/')) == 'flask-socketio'
+
+def test_emit_to_a_local_sid_is_not_published(manager):
+    connect(manager, SID, 'eio1')
+    assert manager._channel_for(emit(SID)) is None
+
+def test_emit_to_a_remote_sid_uses_the_shared_channel(manager):
+    assert manager._channel_for(emit(OTHER_SID)) == 'flask-socketio'
+
+def test_close_room_follows_the_room_channel(manager):
+    data = dict(method='close_room', room='42', namespace='/')
+    assert manager._channel_for(data) == 'flask-socketio:room:/:42'
+
+def test_first_poll_subscribes_to_the_shared_channel(manager):
+    manager._apply_subscriptions()
+    assert manager.pubsub.calls == [('subscribe', {'flask-socketio'})]
+
+def test_joining_a_room_subscribes_once(manager):
+    manager._apply_subscriptions()
+    connect(manager, SID, 'eio1')
+    connect(manager, OTHER_SID, 'eio2')
+    manager.basic_enter_room(SID, '/', '42')
+    manager.basic_enter_room(OTHER_SID, '/', '42')
+    manager._apply_subscriptions()
+    assert manager.pubsub.calls[1:] == [('subscribe', {'flask-socketio:room:/:42'})]
+
+def test_private_and_namespace_rooms_get_no_channel(manager):
+    manager._apply_subscriptions()
+    connect(manager, SID, 'eio1')
+    manager._apply_subscriptions()
+    assert manager.pubsub.calls == [('subscribe', {'flask-socketio'})]
+
+def test_leaving_unsubscribes_when_the_last_local_member_goes(manager):
+    manager._apply_subscriptions()
+    connect(manager, SID, 'eio1')
+    connect(manager, OTHER_SID, 'eio2')
+    manager.basic_enter_room(SID, '/', '42')
+    manager.basic_enter_room(OTHER_SID, '/', '42')
+    manager._apply_subscriptions()
+    manager.basic_leave_room(SID, '/', '42')
+    manager._apply_subscriptions()
+    assert manager.pubsub.calls[-1] == ('subscribe', {'flask-socketio:room:/:42'})
+    manager.basic_leave_room(OTHER_SID, '/', '42')
+    manager._apply_subscriptions()
+    assert manager.pubsub.calls[-1] == ('unsubscribe', {'flask-socketio:room:/:42'})
+
+def test_join_and_leave_between_polls_cancel_out(manager):
+    manager._apply_subscriptions()
+    connect(manager, SID, 'eio1')
+    manager.basic_enter_room(SID, '/', '42')
+    manager.basic_leave_room(SID, '/', '42')
+    manager._apply_subscriptions()
+    assert manager.pubsub.calls == [('subscribe', {'flask-socketio'})]
+
+def test_reconnect_resubscribes_wanted_rooms(manager):
+    manager._apply_subscriptions()
+    connect(manager, SID, 'eio1')
+    manager.basic_enter_room(SID, '/', '42')
+    manager._apply_subscriptions()
+    manager._redis_connect()
+    manager.pubsub = FakePubSub()
+    manager._apply_subscriptions()
+    assert manager.pubsub.calls == [('subscribe', {'flask-socketio', 'flask-socketio:room:/:42'})]
+
+def test_ring_is_deterministic_and_uses_every_node():
+    ring = HashRing(['node-0', 'node-1', 'node-2'])
+    owners = {str(room): ring.node_for(str(room)) for room in range(300)}
+    assert owners == {room: HashRing(['node-2', 'node-0', 'node-1']).node_for(room) for room in owners}
+    assert set(owners.values()) == {'node-0', 'node-1', 'node-2'}
+
+def test_ring_only_moves_rooms_of_the_changed_node():
+    ring = HashRing(['node-0', 'node-1', 'node-2'])
+    before = {str(room): ring.node_for(str(room)) for room in range(300)}
+    ring.add('node-3')
+    after = {room: ring.node_for(room) for room in before}
+    moved = [room for room in before if before[room] != after[room]]
+    assert all(after[room] == 'node-3' for room in moved)
+    assert len(moved) < len(before) / 2
+    ring.remove('node-3')
+    assert {room: ring.node_for(room) for room in before} == before
+
+def test_empty_ring_has_no_owner():
+    assert HashRing().node_for('42') is None
+
+@pytest.fixture
+def sharded():
+    manager = RoomShardedRedisManager('redis://localhost:6379/0', node_id='node-0')
+    manager.pubsub = FakePubSub()
+    manager.emitted = []
+    manager.emit = lambda event, data, **kwargs: manager.emitted.append((event, data, kwargs['room']))
+    return manager
+
+def membership(manager, node_id, state='up'):
+    return {'type': 'message', 'channel': manager.nodes_channel.encode('utf-8'),
+            'data': pickle.dumps({'node_id': node_id, 'state': state})}
+
+def test_sharded_manager_listens_for_membership(sharded, monkeypatch):
+    monkeypatch.setattr(sharded, '_heartbeat', lambda state='up': None)
+    sharded._apply_subscriptions()
+    assert sharded.pubsub.calls == [('subscribe', {'flask-socketio', 'flask-socketio:nodes'})]
+
+def test_room_data_is_not_a_control_message(sharded):
+    assert not sharded._handle_control({'type': 'message', 'channel': b'flask-socketio', 'data': b''})
+
+def test_peers_join_and_leave_the_ring(sharded):
+    assert sharded.ring.nodes == {'node-0'}
+    assert sharded._handle_control(membership(sharded, 'node-1'))
+    assert sharded.ring.nodes == {'node-0', 'node-1'}
+    sharded._handle_control(membership(sharded, 'node-1', state='down'))
+    assert sharded.ring.nodes == {'node-0'}
+
+def test_silent_peers_expire(sharded):
+    sharded._handle_control(membership(sharded, 'node-1'))
+    sharded.peers['node-1'] -= 3 * sharded.heartbeat_interval + 1
+    sharded._update_ring()
+    assert sharded.ring.nodes == {'node-0'}
+
+def test_rebalance_tells_local_members_of_moved_rooms(sharded):
+    connect(sharded, SID, 'eio1')
+    rooms = [str(room) for room in range(40)]
+    for room in rooms:
+        sharded.basic_enter_room(SID, '/', room)
+    sharded._handle_control(membership(sharded, 'node-1'))
+    moved = {room for room in rooms if sharded.node_for(room) == 'node-1'}
+    assert moved
+    assert {room for _, _, room in sharded.emitted} == moved
+    assert all(event == 'room_rebalanced' and data == {'room': room, 'node': 'node-1'}
+               for event, data, room in sharded.emitted)